@@ -1,5 +1,31 @@
 """
 Intitializing Extract and Load Connectors
+Connectors are imported lazily so that importing the package stays cheap for short-lived processes
 """
-from .extract import QuickbooksExtractConnector
-from .load import QuickbooksLoadConnector
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .extract import QuickbooksExtractConnector
+    from .load import QuickbooksLoadConnector
+    from .scheduler import QuickbooksSyncScheduler
+
+__all__ = ['QuickbooksExtractConnector', 'QuickbooksLoadConnector', 'QuickbooksSyncScheduler']
+
+
+def __getattr__(name):
+    # pylint: disable=import-outside-toplevel
+    if name == 'QuickbooksExtractConnector':
+        from .extract import QuickbooksExtractConnector as connector
+    elif name == 'QuickbooksLoadConnector':
+        from .load import QuickbooksLoadConnector as connector
+    elif name == 'QuickbooksSyncScheduler':
+        from .scheduler import QuickbooksSyncScheduler as connector
+    else:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+
+    globals()[name] = connector
+    return connector
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
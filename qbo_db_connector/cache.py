@@ -0,0 +1,191 @@
+"""
+ExtractCache(): TTL cache of reference data extracted from Quickbooks
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict
+
+
+class MemoryCacheStore:
+    """
+    In-process cache store
+    """
+    def __init__(self):
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def get(self, key: str) -> Dict or None:
+        """
+        Get a cache entry
+        :param key: cache key
+        :return: entry or None
+        """
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def set(self, key: str, entry: Dict):
+        """
+        Save a cache entry
+        :param key: cache key
+        :param entry: entry Dict
+        :return: None
+        """
+        with self.__lock:
+            self.__entries[key] = entry
+
+    def delete(self, key_prefix: str):
+        """
+        Delete the cache entries whose key starts with a prefix
+        :param key_prefix: key prefix
+        :return: None
+        """
+        with self.__lock:
+            for key in [key for key in self.__entries if key.startswith(key_prefix)]:
+                del self.__entries[key]
+
+
+class SQLiteCacheStore:
+    """
+    On-disk cache store, entries are kept as JSON in a SQLite database shared across processes
+    """
+    def __init__(self, sqlite_db_file: str):
+        self.__sqlite_db_file = sqlite_db_file
+
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS qbo_extract_cache (key TEXT PRIMARY KEY, entry TEXT)')
+
+    def __connect(self) -> sqlite3.Connection:
+        """
+        Connect to the cache database, connections are not shared so the store can be used from any thread
+        :return: sqlite connection
+        """
+        return sqlite3.connect(self.__sqlite_db_file)
+
+    def get(self, key: str) -> Dict or None:
+        """
+        Get a cache entry
+        :param key: cache key
+        :return: entry or None
+        """
+        conn = self.__connect()
+        try:
+            row = conn.execute('select entry from qbo_extract_cache where key = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, entry: Dict):
+        """
+        Save a cache entry
+        :param key: cache key
+        :param entry: JSON serializable entry Dict
+        :return: None
+        """
+        conn = self.__connect()
+        try:
+            with conn:
+                conn.execute(
+                    'insert or replace into qbo_extract_cache (key, entry) values (?, ?)', (key, json.dumps(entry))
+                )
+        finally:
+            conn.close()
+
+    def delete(self, key_prefix: str):
+        """
+        Delete the cache entries whose key starts with a prefix
+        :param key_prefix: key prefix
+        :return: None
+        """
+        conn = self.__connect()
+        try:
+            with conn:
+                conn.execute('delete from qbo_extract_cache where substr(key, 1, ?) = ?', (len(key_prefix), key_prefix))
+        finally:
+            conn.close()
+
+
+class ExtractCache:
+    """
+    Cache of the records of reference data entities, per realm
+    An entry is fresh for the TTL of its entity. Once it expires the extract connector checks whether
+    any record changed since the LastUpdatedTime of the entry and renews it if nothing did.
+    Only the entities of DEFAULT_TTLS can be cached, they are the ones the extract connector can query for changes.
+    """
+    DEFAULT_TTLS = {
+        'accounts': 3600,
+        'classes': 3600,
+        'departments': 3600,
+        'employees': 3600
+    }
+
+    def __init__(self, ttls: Dict[str, float] = None, store=None, clock: Callable[[], float] = time.time):
+        """
+        :param ttls: TTL in seconds per entity, entities without a TTL are not cached
+        :param store: MemoryCacheStore (default) or SQLiteCacheStore
+        :param clock: clock in seconds
+        """
+        uncacheable_entities = [entity for entity in (ttls or {}) if entity not in self.DEFAULT_TTLS]
+        assert not uncacheable_entities, 'entities {0} cannot be cached'.format(uncacheable_entities)
+
+        self.ttls = ttls if ttls is not None else dict(self.DEFAULT_TTLS)
+        self.__store = store if store else MemoryCacheStore()
+        self.__clock = clock
+
+    @staticmethod
+    def __key(realm_id: str, entity: str = '') -> str:
+        return '{0}:{1}'.format(realm_id, entity)
+
+    def get(self, realm_id: str, entity: str) -> Dict or None:
+        """
+        Get the cached records of an entity
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name
+        :return: Dict with records, last_updated_time and cached_at or None
+        """
+        return self.__store.get(self.__key(realm_id, entity))
+
+    def is_fresh(self, entity: str, entry: Dict) -> bool:
+        """
+        Check if a cache entry is within the TTL of its entity
+        :param entity: entity name
+        :param entry: cache entry
+        :return: True if fresh
+        """
+        return self.__clock() - entry['cached_at'] < self.ttls.get(entity, 0)
+
+    def set(self, realm_id: str, entity: str, records: list, last_updated_time: str or None):
+        """
+        Cache the records of an entity
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name
+        :param records: records to cache
+        :param last_updated_time: latest MetaData.LastUpdatedTime of the records, None if unknown
+        :return: None
+        """
+        self.__store.set(self.__key(realm_id, entity), {
+            'records': records,
+            'last_updated_time': last_updated_time,
+            'cached_at': self.__clock()
+        })
+
+    def renew(self, realm_id: str, entity: str, entry: Dict):
+        """
+        Start a new TTL for an entry whose records did not change
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name
+        :param entry: cache entry
+        :return: None
+        """
+        self.set(realm_id, entity, entry['records'], entry['last_updated_time'])
+
+    def invalidate(self, realm_id: str, entity: str = None):
+        """
+        Drop the cached records of an entity, or of all entities of the realm
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name, None for all entities
+        :return: None
+        """
+        self.__store.delete(self.__key(realm_id, entity) if entity else self.__key(realm_id))
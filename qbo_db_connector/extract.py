@@ -2,123 +2,471 @@
 QuickbooksExtractConnector(): Connection between Quickbooks and Database
 """
 from os import path
+import hashlib
+import json
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
 
-from typing import Dict, List
-import pandas as pd
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterator, List, Tuple
+from urllib.parse import quote
 
-from qbosdk import QuickbooksOnlineSDK
+from .cache import ExtractCache
+from .instrumentation import Span, StageObserver, span
+from .rate_limiter import RateLimiter
+from .retry import CircuitBreaker, RetryPolicy, guarded
+from .sinks import ParquetSink
+
+if TYPE_CHECKING:
+    from qbosdk import QuickbooksOnlineSDK
 
 logger = logging.getLogger('QuickbooksExtractConnector')
 
+EXTRACT_DDL_PATH = path.join(path.dirname(__file__), 'extract_ddl.sql')
+
+
+def _read_extract_column_types(ddl_path: str, entities: List[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Read the columns of the qbo_extract_<entity> tables from the extract DDL
+    :param ddl_path: path of extract_ddl.sql
+    :param entities: entities to read the tables of, the bookkeeping tables of the extract are left out
+    :return: Dict of entity to its column names and types, in table order
+    """
+    ddl_sql = open(ddl_path, 'r').read()
+    extract_column_types = {}
+
+    for entity, table_definition in re.findall(r'CREATE TABLE qbo_extract_(\w+) \((.*?)\);', ddl_sql, re.DOTALL):
+        if entity not in entities:
+            continue
+
+        extract_column_types[entity] = {
+            line.split()[0]: line.split()[1].rstrip(',') for line in table_definition.strip().splitlines()
+            if line.split()[0].upper() not in ('PRIMARY', 'UNIQUE', 'CONSTRAINT', 'CHECK', 'FOREIGN')
+        }
+
+    return extract_column_types
+
 
 class QuickbooksExtractConnector:
     """
     Extract data from Quickbooks and load to Database
     """
-    def __init__(self, qbo_connection: QuickbooksOnlineSDK, dbconn):
+    ENTITIES = ['accounts', 'classes', 'departments', 'employees', 'exchange_rates', 'home_currency']
+
+    # Quickbooks object types of the entities that support incremental extraction
+    QUERY_OBJECT_TYPES = {
+        'accounts': 'Account',
+        'classes': 'Class',
+        'departments': 'Department',
+        'employees': 'Employee'
+    }
+
+    # columns of the qbo_extract_<entity> tables, projected from the Quickbooks records
+    # extract_ddl.sql is the single spec of the columns, for the tables as well as the projected queries
+    EXTRACT_COLUMN_TYPES = _read_extract_column_types(EXTRACT_DDL_PATH, ENTITIES)
+    EXTRACT_COLUMNS = {entity: list(column_types) for entity, column_types in EXTRACT_COLUMN_TYPES.items()}
+
+    PAGE_QUERY_URL = '/query?query=select {0} from {1}{2} STARTPOSITION {3} MAXRESULTS {4}'
+
+    # Quickbooks returns at most 1000 records per query, whatever MAXRESULTS asks for
+    MAX_PAGE_SIZE = 1000
+
+    EXCHANGE_RATES_QUERY_URL = "/query?query=select * from ExchangeRate where AsOfDate = '{0}' " \
+                               "STARTPOSITION {{0}} MAXRESULTS 1000"
+
+    CHANGES_COUNT_QUERY_URL = "/query?query=select count(*) from {0} where Active in (true, false) " \
+                              "and MetaData.LastUpdatedTime > '{1}'"
+
+    def __init__(self, qbo_connection: 'QuickbooksOnlineSDK', dbconn, realm_id: str = None,
+                 rate_limiter: RateLimiter = None, cache: ExtractCache = None, projection: bool = False,
+                 observers: List[StageObserver] = None, sink: ParquetSink = None, retry_policy: RetryPolicy = None,
+                 circuit_breaker: CircuitBreaker = None):
+        """
+        :param qbo_connection: Quickbooks SDK connection
+        :param dbconn: database connection, None to only write to the sink
+        :param realm_id: Quickbooks realm / company id, keys watermarks, cache entries and sink partitions
+        :param rate_limiter: rate limiter of the realm
+        :param cache: cache of reference data entities
+        :param projection: only query the extract table columns from Quickbooks
+        :param observers: stage observers
+        :param sink: columnar sink written alongside (or, without dbconn, instead of) the database
+        :param retry_policy: retry policy of transient Quickbooks failures
+        :param circuit_breaker: circuit breaker of the realm
+        """
+        assert dbconn is not None or sink is not None, 'dbconn or sink is required'
+
         self.__qbo_connection = qbo_connection
         self.__dbconn = dbconn
+        self.__realm_id = realm_id if realm_id else ''
+        self.__rate_limiter = rate_limiter
+        self.__cache = cache
+        self.__projection = projection
+        self.__observers = observers if observers else []
+        self.__sink = sink
+        self.__retry_policy = retry_policy
+        self.__circuit_breaker = circuit_breaker
+        self.__in_transaction = False
+
+        self.__writers = {
+            'accounts': self.__write_accounts,
+            'classes': self.__write_classes,
+            'departments': self.__write_departments,
+            'employees': self.__write_employees,
+            'exchange_rates': self.__write_exchange_rates,
+            'home_currency': self.__write_home_currency
+        }
 
     def create_tables(self):
         """
         Creates DB tables
         :return: None
         """
-        basepath = path.dirname(__file__)
-        ddl_path = path.join(basepath, 'extract_ddl.sql')
-        ddl_sql = open(ddl_path, 'r').read()
+        assert self.__dbconn is not None, 'no dbconn to create tables in'
+
+        ddl_sql = open(EXTRACT_DDL_PATH, 'r').read()
         self.__dbconn.executescript(ddl_sql)
 
-    def extract_accounts(self) -> List[str]:
+    def __commit(self):
+        """
+        Commit dbconn, unless the writes are part of a transaction() that commits them all at once
+        :return: None
+        """
+        if not self.__in_transaction:
+            self.__dbconn.commit()
+
+    @contextmanager
+    def transaction(self, wal: bool = False, synchronous: str = None) -> Iterator['QuickbooksExtractConnector']:
+        """
+        Run the extracts made within the block in a single transaction, committed when the block exits
+        and rolled back if it raises. Other connections keep reading the previous tables until the commit
+        :param wal: switch the SQLite database to write-ahead logging, so readers are not blocked by the commit
+        :param synchronous: SQLite synchronous level, one of OFF, NORMAL, FULL or EXTRA (NORMAL is safe with WAL)
+        :return: this connector
+        """
+        assert self.__dbconn is not None, 'transactions need a dbconn'
+        assert not self.__in_transaction, 'transaction already in progress'
+        assert synchronous is None or synchronous.upper() in ('OFF', 'NORMAL', 'FULL', 'EXTRA'), \
+            'unknown synchronous level {0}'.format(synchronous)
+
+        # pragmas have no effect inside a transaction, so set them before it starts
+        self.__dbconn.commit()
+        if wal:
+            self.__dbconn.execute('PRAGMA journal_mode=WAL')
+        if synchronous:
+            self.__dbconn.execute('PRAGMA synchronous={0}'.format(synchronous.upper()))
+
+        self.__dbconn.execute('BEGIN IMMEDIATE')
+        self.__in_transaction = True
+
+        try:
+            yield self
+        except BaseException:
+            self.__dbconn.rollback()
+            logger.info('Extract transaction rolled back.')
+            raise
+        else:
+            self.__dbconn.commit()
+        finally:
+            self.__in_transaction = False
+
+    def __span(self, entity: str, stage: str) -> ContextManager[Span]:
+        """
+        Time a stage of an entity extract and report it to the observers as <entity>.<stage>
+        :param entity: entity name
+        :param stage: qbo_api, cache_read, db_read, transform or db_write
+        :return: span context manager
+        """
+        return span(self.__observers, '{0}.{1}'.format(entity, stage))
+
+    def __call_qbo(self, entity: str, function: Callable, *args, **kwargs):
+        """
+        Call a Quickbooks SDK function through the retry policy, circuit breaker and rate limiter of the connector
+        :param entity: entity the call is made for, names the qbo_api span
+        :param function: SDK function, e.g. self.__qbo_connection.accounts.get
+        :return: return value of the function
+        """
+        with self.__span(entity, 'qbo_api') as stage_span:
+            response = guarded(
+                function, self.__retry_policy, self.__circuit_breaker, self.__rate_limiter
+            )(*args, **kwargs)
+
+            if isinstance(response, list):
+                stage_span.rows = len(response)
+            else:
+                # a query response holds maxResults records
+                stage_span.rows = response.get('maxResults', 1) if isinstance(response, dict) else 1
+
+        return response
+
+    def __fetch(self, entity: str, force_refresh: bool = False):
+        """
+        Fetch the records of an entity from Quickbooks, or from the cache if it holds them
+        :param entity: entity name
+        :param force_refresh: bypass the cache and fetch from Quickbooks
+        :return: records returned by Quickbooks (preferences Dict for home_currency)
+        """
+        if self.__cache and self.__cache.ttls.get(entity):
+            return self.__fetch_cached(entity, force_refresh)
+
+        return self.__fetch_all(entity)
+
+    def __select_list(self, entity: str, *extra_columns: str) -> str:
+        """
+        Columns to select in Quickbooks queries of an entity
+        In projection mode only the extract table columns are selected, plus MetaData for LastUpdatedTime
+        :param entity: entity name
+        :param extra_columns: other columns needed by the query
+        :return: select list
+        """
+        if not self.__projection:
+            return '*'
+
+        return ', '.join(self.EXTRACT_COLUMNS[entity] + ['MetaData'] + list(extra_columns))
+
+    def __fetch_all(self, entity: str):
+        """
+        Fetch all the records of an entity from Quickbooks
+        List entities are queried a page at a time, in projection mode for the extract table columns only
+        :param entity: entity name
+        :return: records returned by Quickbooks (preferences Dict for home_currency)
+        """
+        if entity in self.QUERY_OBJECT_TYPES:
+            # page by page, every page takes its own rate limiter token
+            return [record for page in self.__query_pages(entity) for record in page]
+
+        sdk_api = 'preferences' if entity == 'home_currency' else entity
+        return self.__call_qbo(entity, getattr(self.__qbo_connection, sdk_api).get)
+
+    def __fetch_cached(self, entity: str, force_refresh: bool) -> List[Dict]:
+        """
+        Fetch the records of an entity through the cache
+        Expired entries are renewed without fetching the records if none changed since they were cached
+        :param entity: entity name
+        :param force_refresh: bypass the cache and fetch from Quickbooks
+        :return: records
+        """
+        entry = None
+        if not force_refresh:
+            with self.__span(entity, 'cache_read') as stage_span:
+                entry = self.__cache.get(self.__realm_id, entity)
+                stage_span.rows = len(entry['records']) if entry else 0
+
+        if entry and self.__cache.is_fresh(entity, entry):
+            logger.info('%s served from cache.', entity)
+            return entry['records']
+
+        if entry and not self.__has_changes(entity, entry):
+            logger.info('%s unchanged since %s, cache renewed.', entity, entry['last_updated_time'])
+            self.__cache.renew(self.__realm_id, entity, entry)
+            return entry['records']
+
+        data = self.__fetch_all(entity)
+
+        columns = self.EXTRACT_COLUMNS[entity]
+        last_updated_times = [
+            record['MetaData']['LastUpdatedTime'] for record in data if 'LastUpdatedTime' in record.get('MetaData', {})
+        ]
+        self.__cache.set(
+            self.__realm_id, entity,
+            [{column: record.get(column) for column in columns} for record in data],
+            max(last_updated_times, key=self.__parse_updated_time) if last_updated_times else None
+        )
+
+        return data
+
+    def __has_changes(self, entity: str, entry: Dict) -> bool:
+        """
+        Check if any record of an entity changed since a cache entry was made
+        :param entity: entity name
+        :param entry: cache entry
+        :return: True if records changed or it cannot be told
+        """
+        if not entry['last_updated_time']:
+            return True
+
+        # pylint: disable=protected-access
+        query_response = self.__call_qbo(
+            entity, getattr(self.__qbo_connection, entity)._get_request,
+            'QueryResponse',
+            self.CHANGES_COUNT_QUERY_URL.format(
+                self.QUERY_OBJECT_TYPES[entity], self.__quote_updated_time(entry['last_updated_time'])
+            )
+        )
+
+        return bool(query_response.get('totalCount', 0))
+
+    def __select(self, entity: str, sql: str, parameters: tuple = ()) -> List[tuple]:
+        """
+        Run a select on dbconn, returning plain tuples whatever the row_factory of dbconn
+        :param entity: entity the select is made for, names the db_read span
+        :param sql: select statement
+        :param parameters: bound parameters of the statement
+        :return: List of rows
+        """
+        with self.__span(entity, 'db_read') as stage_span:
+            cursor = self.__dbconn.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(sql, parameters).fetchall()
+            stage_span.rows = len(rows)
+
+        return rows
+
+    def __sink_partition(self, entity: str) -> ContextManager:
+        """
+        Replace the sink partition of an entity with the rows of a full extract written within the block
+        Exchange rates are appended, extract_exchange_rates_range writes rates of other days to the same partition
+        :param entity: entity name
+        :return: context manager
+        """
+        if self.__sink is None or entity == 'exchange_rates':
+            return nullcontext()
+
+        return self.__sink.replace(self.__realm_id, entity)
+
+    def __insert_rows(self, entity: str, data: List[Dict]) -> List[tuple]:
+        """
+        Bulk upsert Quickbooks records into the extract table of an entity in a single transaction
+        Rows are keyed on the primary key of the table (Id for list entities), so re-extracting a record
+        replaces it instead of adding a duplicate. Only the EXTRACT_COLUMNS of the entity are kept,
+        missing keys are inserted as NULL. Rows are also written to the sink if there is one
+        :param entity: entity name
+        :param data: records returned by Quickbooks
+        :return: List of upserted rows
+        """
+        columns = self.EXTRACT_COLUMNS[entity]
+
+        with self.__span(entity, 'transform') as stage_span:
+            rows = [tuple(record.get(column) for column in columns) for record in data]
+            stage_span.rows = len(rows)
+
+        if rows and self.__sink:
+            with self.__span(entity, 'sink_write') as stage_span:
+                self.__sink.write(self.__realm_id, entity, self.EXTRACT_COLUMN_TYPES[entity], rows)
+                stage_span.rows = len(rows)
+
+        if rows and self.__dbconn is not None:
+            with self.__span(entity, 'db_write') as stage_span:
+                self.__dbconn.executemany(
+                    'insert or replace into qbo_extract_{0} ({1}) values ({2})'.format(
+                        entity, ', '.join(columns), ', '.join('?' * len(columns))
+                    ),
+                    rows
+                )
+                self.__commit()
+                stage_span.rows = len(rows)
+
+        return rows
+
+    def extract_accounts(self, incremental: bool = False, force_refresh: bool = False) -> List[str]:
         """
         Extract accounts from Quickbooks
+        :param incremental: only extract accounts changed since the last incremental extract
+        :param force_refresh: fetch from Quickbooks even if the cache holds accounts
         :return: List of account ids
         """
+        if incremental:
+            return self.__extract_incremental('accounts')
+
         logger.info('Extracting accounts from Quickbooks.')
 
-        data = self.__qbo_connection.accounts.get()
+        data = self.__fetch('accounts', force_refresh)
 
         logger.info('%s accounts Extracted.', len(data))
 
-        if data:
-            df = pd.DataFrame(data)
-
-            df = df[['Id', 'Name']]
-            df.to_sql('qbo_extract_accounts', self.__dbconn, if_exists='append', index=False)
+        with self.__sink_partition('accounts'):
+            return self.__write_accounts(data)
 
-            return df['Id'].to_list()
-
-        return []
+    def __write_accounts(self, data: List[Dict]) -> List[str]:
+        """
+        Write extracted accounts to Database
+        :param data: accounts returned by Quickbooks
+        :return: List of account ids
+        """
+        return [row[0] for row in self.__insert_rows('accounts', data)]
 
-    def extract_classes(self) -> List[str]:
+    def extract_classes(self, incremental: bool = False, force_refresh: bool = False) -> List[str]:
         """
         Extract classes from Quickbooks
+        :param incremental: only extract classes changed since the last incremental extract
+        :param force_refresh: fetch from Quickbooks even if the cache holds classes
         :return: List of class ids
         """
+        if incremental:
+            return self.__extract_incremental('classes')
+
         logger.info('Extracting classes from Quickbooks.')
 
-        data = self.__qbo_connection.classes.get()
+        data = self.__fetch('classes', force_refresh)
 
         logger.info('%s classes Extracted.', len(data))
 
-        if data:
-            df = pd.DataFrame(data)
-            df = df[['Id', 'Name']]
-            df.to_sql('qbo_extract_classes', self.__dbconn, if_exists='append', index=False)
+        with self.__sink_partition('classes'):
+            return self.__write_classes(data)
 
-            return df['Id'].to_list()
-
-        return []
+    def __write_classes(self, data: List[Dict]) -> List[str]:
+        """
+        Write extracted classes to Database
+        :param data: classes returned by Quickbooks
+        :return: List of class ids
+        """
+        return [row[0] for row in self.__insert_rows('classes', data)]
 
-    def extract_departments(self) -> List[str]:
+    def extract_departments(self, incremental: bool = False, force_refresh: bool = False) -> List[str]:
         """
         Extract departments from Quickbooks
+        :param incremental: only extract departments changed since the last incremental extract
+        :param force_refresh: fetch from Quickbooks even if the cache holds departments
         :return: List of department ids
         """
+        if incremental:
+            return self.__extract_incremental('departments')
+
         logger.info('Extracting departments from Quickbooks.')
 
-        data = self.__qbo_connection.departments.get()
+        data = self.__fetch('departments', force_refresh)
 
         logger.info('%s departments Extracted.', len(data))
 
-        if data:
-            df = pd.DataFrame(data)
-            df = df[['Id', 'Name']]
-            df.to_sql('qbo_extract_departments', self.__dbconn, if_exists='append', index=False)
-
-            return df['Id'].to_list()
+        with self.__sink_partition('departments'):
+            return self.__write_departments(data)
 
-        return []
+    def __write_departments(self, data: List[Dict]) -> List[str]:
+        """
+        Write extracted departments to Database
+        :param data: departments returned by Quickbooks
+        :return: List of department ids
+        """
+        return [row[0] for row in self.__insert_rows('departments', data)]
 
-    def extract_employees(self) -> List[str]:
+    def extract_employees(self, incremental: bool = False, force_refresh: bool = False) -> List[str]:
         """
         Extract employees from Quickbooks
+        :param incremental: only extract employees changed since the last incremental extract
+        :param force_refresh: fetch from Quickbooks even if the cache holds employees
         :return: List of employee Ids
         """
+        if incremental:
+            return self.__extract_incremental('employees')
+
         logger.info('Extracting employees from Quickbooks.')
 
-        data = self.__qbo_connection.employees.get()
+        data = self.__fetch('employees', force_refresh)
 
         logger.info('%s employees Extracted.', len(data))
 
-        if data:
-            df = pd.DataFrame(data)
-
-            if 'GivenName' not in df:
-                df['GivenName'] = None
-
-            if 'FamilyName' not in df:
-                df['FamilyName'] = None
-
-            if 'DisplayName' not in df:
-                df['DisplayName'] = None
-
-            df = df[['Id', 'GivenName', 'FamilyName', 'DisplayName']]
-            df.to_sql('qbo_extract_employees', self.__dbconn, if_exists='append', index=False)
-            return df['Id'].to_list()
+        with self.__sink_partition('employees'):
+            return self.__write_employees(data)
 
-        return []
+    def __write_employees(self, data: List[Dict]) -> List[str]:
+        """
+        Write extracted employees to Database
+        :param data: employees returned by Quickbooks
+        :return: List of employee Ids
+        """
+        return [row[0] for row in self.__insert_rows('employees', data)]
 
     def extract_exchange_rates(self) -> List[Dict]:
         """
@@ -127,20 +475,71 @@ class QuickbooksExtractConnector:
         """
         logger.info('Extracting exchange rates from Quickbooks.')
 
-        exchange_rates = self.__qbo_connection.exchange_rates.get()
+        exchange_rates = self.__fetch('exchange_rates')
 
         logger.info('%s exchange rates Extracted.', len(exchange_rates))
 
-        if exchange_rates:
-            df_exchange_rates = pd.DataFrame(exchange_rates)
+        return self.__write_exchange_rates(exchange_rates)
+
+    def __write_exchange_rates(self, exchange_rates: List[Dict]) -> List[Dict]:
+        """
+        Write extracted exchange rates to Database
+        :param exchange_rates: exchange rates returned by Quickbooks
+        :return: List of exchange rates Dict
+        """
+        columns = self.EXTRACT_COLUMNS['exchange_rates']
+
+        return [dict(zip(columns, row)) for row in self.__insert_rows('exchange_rates', exchange_rates)]
 
-            df_exchange_rates = df_exchange_rates[['SourceCurrencyCode', 'TargetCurrencyCode', 'Rate', 'AsOfDate']]
+    def extract_exchange_rates_range(self, start_date: str, end_date: str, max_workers: int = 4) -> List[Dict]:
+        """
+        Backfill currency exchange rates of every day in a date range from Quickbooks
+        Dates already in qbo_extract_exchange_rates are skipped, the others are fetched concurrently
+        Without a dbconn every date is fetched
+        :param start_date: first AsOfDate, YYYY-MM-DD
+        :param end_date: last AsOfDate (inclusive), YYYY-MM-DD
+        :param max_workers: maximum number of concurrent Quickbooks calls
+        :return: List of extracted exchange rates Dict
+        """
+        first_date = date.fromisoformat(start_date)
+        as_of_dates = [
+            (first_date + timedelta(days=day)).isoformat()
+            for day in range((date.fromisoformat(end_date) - first_date).days + 1)
+        ]
 
-            df_exchange_rates.to_sql('qbo_extract_exchange_rates', self.__dbconn,
-                                     if_exists='append', index=False)
-            return df_exchange_rates.to_dict(orient='records')
+        # str() as the AsOfDate DATE column comes back as datetime.date when dbconn parses declared types
+        extracted_dates = {
+            str(row[0]) for row in self.__select(
+                'exchange_rates',
+                'select distinct AsOfDate from qbo_extract_exchange_rates where AsOfDate between ? and ?',
+                (start_date, end_date)
+            )
+        } if self.__dbconn is not None else set()
+        missing_dates = [as_of_date for as_of_date in as_of_dates if as_of_date not in extracted_dates]
+
+        logger.info('Extracting exchange rates of %s days from Quickbooks.', len(missing_dates))
+
+        if not missing_dates:
+            return []
+
+        # ExchangeRates.get(as_of_date) rewrites a class attribute, so query the SDK directly instead
+        def fetch(as_of_date: str) -> List[Dict]:
+            # pylint: disable=protected-access
+            return self.__call_qbo(
+                'exchange_rates', self.__qbo_connection.exchange_rates._query_get_all,
+                'ExchangeRate', self.EXCHANGE_RATES_QUERY_URL.format(as_of_date)
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing_dates)))) as executor:
+            exchange_rates = [
+                exchange_rate
+                for day_exchange_rates in executor.map(fetch, missing_dates)
+                for exchange_rate in day_exchange_rates
+            ]
 
-        return []
+        logger.info('%s exchange rates Extracted.', len(exchange_rates))
+
+        return self.__write_exchange_rates(exchange_rates)
 
     def extract_home_currency(self) -> str:
         """
@@ -149,18 +548,355 @@ class QuickbooksExtractConnector:
         """
         logger.info('Extracting home currency')
 
-        data = self.__qbo_connection.preferences.get()
+        data = self.__fetch('home_currency')
+
+        with self.__sink_partition('home_currency'):
+            home_currency = self.__write_home_currency(data)
+
+        logger.info('home currency extracted')
+
+        return home_currency
 
+    def __write_home_currency(self, data: Dict) -> str:
+        """
+        Write home currency from Quickbooks preferences to Database
+        :param data: preferences returned by Quickbooks
+        :return: home currency
+        """
         currency_dict = [
             {
                 'home_currency': data['CurrencyPrefs']['HomeCurrency']['value']
             }
         ]
 
-        logger.info('home currency extracted')
+        self.__insert_rows('home_currency', currency_dict)
+
+        return currency_dict[0]['home_currency']
 
-        df_currency = pd.DataFrame(currency_dict)
+    @staticmethod
+    def __quote_updated_time(last_updated_time: str) -> str:
+        """
+        Percent-encode a LastUpdatedTime for a query url, the + of offsets east of UTC would be read as a space
+        :param last_updated_time: time in ISO 8601 format, e.g. 2021-01-01T10:00:00+05:30
+        :return: encoded time
+        """
+        return quote(last_updated_time, safe='')
 
-        df_currency.to_sql('qbo_extract_home_currency', self.__dbconn, if_exists='append', index=False)
+    @staticmethod
+    def __parse_updated_time(last_updated_time: str) -> datetime:
+        """
+        Parse a Quickbooks MetaData.LastUpdatedTime
+        :param last_updated_time: time in ISO 8601 format, e.g. 2019-10-29T01:43:14-07:00
+        :return: timezone aware datetime
+        """
+        return datetime.fromisoformat(last_updated_time.replace('Z', '+00:00'))
 
-        return currency_dict[0]['home_currency']
+    def __get_watermark(self, entity: str) -> str or None:
+        """
+        Get the LastUpdatedTime watermark of an entity for the realm
+        :param entity: entity name
+        :return: watermark or None if the entity was never extracted incrementally
+        """
+        assert self.__dbconn is not None, 'incremental extracts keep their watermarks in dbconn'
+
+        rows = self.__select(
+            entity, 'select last_updated_time from qbo_extract_watermarks where realm_id = ? and entity = ?',
+            (self.__realm_id, entity)
+        )
+
+        return rows[0][0] if rows else None
+
+    def __set_watermark(self, entity: str, last_updated_time: str):
+        """
+        Save the LastUpdatedTime watermark of an entity for the realm
+        :param entity: entity name
+        :param last_updated_time: latest LastUpdatedTime applied to the extract table
+        :return: None
+        """
+        self.__dbconn.execute(
+            'insert or replace into qbo_extract_watermarks (realm_id, entity, last_updated_time) values (?, ?, ?)',
+            (self.__realm_id, entity, last_updated_time)
+        )
+        self.__commit()
+
+    def __fetch_changes(self, entity: str, watermark: str or None) -> (List[Dict], str or None):
+        """
+        Fetch the records of an entity changed since its watermark, including deactivated ones
+        The watermark is read by the caller, as dbconn may not be used from the threads fetching the records
+        :param entity: entity name
+        :param watermark: watermark of the entity, None to fetch all records
+        :return: changed records and the watermark they were fetched from
+        """
+        condition = ' where Active in (true, false)'
+        if watermark:
+            # >= so that records updated in the same second as the watermark are not missed
+            condition = "{0} and MetaData.LastUpdatedTime >= '{1}'".format(
+                condition, self.__quote_updated_time(watermark)
+            )
+
+        data = [
+            record for page in self.__query_pages(entity, condition, extra_columns=('Active',)) for record in page
+        ]
+
+        return data, watermark
+
+    def __apply_changes(self, entity: str, data: List[Dict], watermark: str or None) -> List[str]:
+        """
+        Apply changed records of an entity to its extract table and move the watermark forward
+        :param entity: entity name
+        :param data: changed records returned by Quickbooks
+        :param watermark: watermark the records were fetched from, None for a full extract
+        :return: List of inserted / updated ids
+        """
+        table_name = 'qbo_extract_{0}'.format(entity)
+
+        with self.__span(entity, 'db_write') as stage_span:
+            if watermark:
+                deleted_ids = [(row['Id'],) for row in data if not row.get('Active', True)]
+                self.__dbconn.executemany('delete from {0} where Id = ?'.format(table_name), deleted_ids)
+                stage_span.rows = len(deleted_ids)
+            else:
+                self.__dbconn.execute('delete from {0}'.format(table_name))
+            self.__commit()
+
+        with self.__sink_partition(entity) if not watermark else nullcontext():
+            ids = self.__writers[entity]([row for row in data if row.get('Active', True)])
+
+        if data:
+            last_updated_time = max(
+                (row['MetaData']['LastUpdatedTime'] for row in data),
+                key=self.__parse_updated_time
+            )
+            self.__set_watermark(entity, last_updated_time)
+
+        return ids
+
+    def __extract_incremental(self, entity: str) -> List[str]:
+        """
+        Extract records of an entity changed since the last incremental extract
+        Deactivated (deleted) records are removed from the extract table
+        :param entity: entity name
+        :return: List of inserted / updated ids
+        """
+        logger.info('Extracting changed %s from Quickbooks.', entity)
+
+        data, watermark = self.__fetch_changes(entity, self.__get_watermark(entity))
+
+        logger.info('%s changed %s Extracted.', len(data), entity)
+
+        return self.__apply_changes(entity, data, watermark)
+
+    def __query_pages(self, entity: str, condition: str = '', page_size: int = 1000,
+                      extra_columns: tuple = ()) -> Iterator[List[Dict]]:
+        """
+        Query records of an entity from Quickbooks one page at a time
+        :param entity: entity name
+        :param condition: where clause appended to the query
+        :param page_size: number of records per page (MAXRESULTS), at most 1000
+        :param extra_columns: other columns needed by the query, in projection mode
+        :return: Iterator of pages of records
+        """
+        # a larger page would come back capped and end the loop early, dropping the remaining records
+        assert 0 < page_size <= self.MAX_PAGE_SIZE, 'page_size must be between 1 and {0}'.format(self.MAX_PAGE_SIZE)
+
+        object_type = self.QUERY_OBJECT_TYPES[entity]
+        select_list = self.__select_list(entity, *extra_columns)
+        start_position = 1
+
+        while True:
+            # pylint: disable=protected-access
+            query_url = self.PAGE_QUERY_URL.format(select_list, object_type, condition, start_position, page_size)
+            query_response = self.__call_qbo(
+                entity, getattr(self.__qbo_connection, entity)._get_request, 'QueryResponse', query_url
+            )
+            page = query_response.get(object_type, []) if query_response else []
+
+            if page:
+                yield page
+
+            if len(page) < page_size:
+                return
+
+            start_position = start_position + page_size
+
+    def stream_extract(self, entity: str, page_size: int = 1000) -> Iterator[str]:
+        """
+        Extract an entity from Quickbooks page by page, writing each page to Database as it arrives
+        Pages are fetched lazily, only as the returned ids are consumed
+        :param entity: one of QUERY_OBJECT_TYPES
+        :param page_size: number of records per page (MAXRESULTS), at most 1000
+        :return: Iterator of extracted ids
+        """
+        assert entity in self.QUERY_OBJECT_TYPES, '{0} cannot be streamed'.format(entity)
+
+        logger.info('Streaming %s from Quickbooks.', entity)
+
+        count = 0
+        with self.__sink_partition(entity):
+            for page in self.__query_pages(entity, page_size=page_size):
+                ids = self.__writers[entity](page)
+                count = count + len(ids)
+
+                logger.info('%s %s Extracted.', count, entity)
+
+                yield from ids
+
+    @staticmethod
+    def __fingerprint(row: tuple) -> str:
+        """
+        Hash of the projected columns of a row
+        :param row: row of an extract table
+        :return: hex digest
+        """
+        return hashlib.sha1(json.dumps(row, default=str).encode('utf-8')).hexdigest()
+
+    def extract_changes(self, entity: str, page_size: int = 1000) -> Dict[str, List[str]]:
+        """
+        Full extract of an entity that also tells which records changed since the previous extract_changes()
+        Pages are written to the extract table as they arrive while their row fingerprints are staged in a
+        temp table, which is then compared with the fingerprints stored by the previous run. Records missing
+        from Quickbooks are deleted from the extract table
+        :param entity: one of QUERY_OBJECT_TYPES
+        :param page_size: number of records per page (MAXRESULTS), at most 1000
+        :return: Dict with inserted, updated and deleted ids
+        """
+        assert entity in self.QUERY_OBJECT_TYPES, '{0} changes cannot be extracted'.format(entity)
+        assert self.__dbconn is not None, 'fingerprints are kept in dbconn'
+
+        logger.info('Extracting %s changes from Quickbooks.', entity)
+
+        self.__dbconn.execute(
+            'create temp table if not exists qbo_extract_fingerprints_staging (Id TEXT PRIMARY KEY, fingerprint TEXT)'
+        )
+        self.__dbconn.execute('delete from qbo_extract_fingerprints_staging')
+
+        with self.__sink_partition(entity):
+            for page in self.__query_pages(entity, page_size=page_size):
+                rows = self.__insert_rows(entity, page)
+                self.__dbconn.executemany(
+                    'insert or replace into qbo_extract_fingerprints_staging (Id, fingerprint) values (?, ?)',
+                    [(row[0], self.__fingerprint(row)) for row in rows]
+                )
+
+        changes = {
+            'inserted': [row[0] for row in self.__select(
+                entity,
+                'select s.Id from qbo_extract_fingerprints_staging s left join qbo_extract_fingerprints f '
+                'on f.entity = ? and f.Id = s.Id where f.Id is null',
+                (entity,)
+            )],
+            'updated': [row[0] for row in self.__select(
+                entity,
+                'select s.Id from qbo_extract_fingerprints_staging s join qbo_extract_fingerprints f '
+                'on f.entity = ? and f.Id = s.Id where f.fingerprint != s.fingerprint',
+                (entity,)
+            )],
+            'deleted': [row[0] for row in self.__select(
+                entity,
+                'select Id from qbo_extract_fingerprints where entity = ? '
+                'and Id not in (select Id from qbo_extract_fingerprints_staging)',
+                (entity,)
+            )]
+        }
+
+        with self.__span(entity, 'db_write') as stage_span:
+            deleted = self.__dbconn.execute(
+                'delete from qbo_extract_{0} where Id not in (select Id from qbo_extract_fingerprints_staging)'.format(
+                    entity
+                )
+            )
+            self.__dbconn.execute('delete from qbo_extract_fingerprints where entity = ?', (entity,))
+            self.__dbconn.execute(
+                'insert into qbo_extract_fingerprints (entity, Id, fingerprint) '
+                'select ?, Id, fingerprint from qbo_extract_fingerprints_staging',
+                (entity,)
+            )
+            self.__dbconn.execute('delete from qbo_extract_fingerprints_staging')
+            self.__commit()
+            stage_span.rows = deleted.rowcount
+
+        logger.info(
+            '%s %s inserted, %s updated, %s deleted.',
+            len(changes['inserted']), entity, len(changes['updated']), len(changes['deleted'])
+        )
+
+        return changes
+
+    def __timed_fetch(self, entity: str, watermarks: Dict[str, str], force_refresh: bool) -> Tuple[Any, float]:
+        """
+        Fetch an entity from Quickbooks, runs on the pool of extract_all and never touches dbconn
+        :param entity: entity to fetch
+        :param watermarks: watermarks read on the calling thread, for the entities extracted incrementally
+        :param force_refresh: fetch from Quickbooks even if the cache holds the records
+        :return: fetched data and fetch time in seconds
+        """
+        start_time = time.perf_counter()
+        if entity in watermarks:
+            data = self.__fetch_changes(entity, watermarks[entity])
+        else:
+            data = self.__fetch(entity, force_refresh)
+        return data, time.perf_counter() - start_time
+
+    def __timed_write(self, entity: str, data: Any, incremental: bool) -> Tuple[Any, float]:
+        """
+        Write fetched data of an entity to dbconn, on the calling thread
+        :param entity: entity to write
+        :param data: data returned by __timed_fetch
+        :param incremental: data holds changes to apply rather than all records
+        :return: extracted ids / values and write time in seconds
+        """
+        start_time = time.perf_counter()
+        if incremental:
+            ids = self.__apply_changes(entity, *data)
+        else:
+            with self.__sink_partition(entity):
+                ids = self.__writers[entity](data)
+        return ids, time.perf_counter() - start_time
+
+    def extract_all(self, entities: List[str] = None, max_workers: int = 4, incremental: bool = False,
+                    force_refresh: bool = False, atomic: bool = False) -> Dict:
+        """
+        Extract multiple entities from Quickbooks, fetching them concurrently
+        Quickbooks calls run on a bounded pool of threads while database writes stay serialized on dbconn
+        :param entities: entities to extract, defaults to ENTITIES
+        :param max_workers: maximum number of concurrent Quickbooks calls
+        :param incremental: only extract changed records of entities that support it (QUERY_OBJECT_TYPES)
+        :param force_refresh: fetch from Quickbooks even if the cache holds the records
+        :param atomic: write all entities in a single transaction, nothing is written if any entity fails
+        :return: Dict with extracted ids / values per entity and timings (in seconds) per entity
+        """
+        entities = entities if entities else self.ENTITIES
+
+        unknown_entities = [entity for entity in entities if entity not in self.ENTITIES]
+        assert not unknown_entities, 'unknown entities {0}'.format(unknown_entities)
+
+        # read on the calling thread, dbconn is not shared with the fetching threads
+        watermarks = {
+            entity: self.__get_watermark(entity)
+            for entity in entities if incremental and entity in self.QUERY_OBJECT_TYPES
+        }
+
+        logger.info('Extracting %s from Quickbooks.', ', '.join(entities))
+
+        result = {
+            'ids': {},
+            'timings': {}
+        }
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(entities)))) as executor:
+            futures = {
+                entity: executor.submit(self.__timed_fetch, entity, watermarks, force_refresh) for entity in entities
+            }
+
+            with self.transaction() if atomic and not self.__in_transaction else nullcontext():
+                for entity in entities:
+                    data, fetch_time = futures[entity].result()
+                    result['ids'][entity], write_time = self.__timed_write(entity, data, entity in watermarks)
+
+                    result['timings'][entity] = {
+                        'fetch': fetch_time,
+                        'write': write_time
+                    }
+                    logger.info('%s extracted in %.3fs.', entity, fetch_time + write_time)
+
+        return result
@@ -6,34 +6,49 @@ DROP TABLE IF EXISTS qbo_extract_home_currency;
 DROP TABLE IF EXISTS qbo_extract_exchange_rates;
 
 CREATE TABLE qbo_extract_classes (
-    Id TEXT,
+    Id TEXT PRIMARY KEY,
     Name TEXT
 );
 
 CREATE TABLE qbo_extract_departments (
-    Id TEXT,
+    Id TEXT PRIMARY KEY,
     Name TEXT
 );
 
 CREATE TABLE qbo_extract_accounts (
-    Id TEXT,
+    Id TEXT PRIMARY KEY,
     Name TEXT
 );
 
 CREATE TABLE qbo_extract_employees (
-    Id TEXT,
+    Id TEXT PRIMARY KEY,
     GivenName TEXT,
     FamilyName TEXT,
     DisplayName TEXT
 );
 
 CREATE TABLE qbo_extract_home_currency (
-    home_currency TEXT
+    home_currency TEXT PRIMARY KEY
 );
 
 CREATE TABLE qbo_extract_exchange_rates (
     SourceCurrencyCode TEXT,
     TargetCurrencyCode TEXT,
     Rate REAL,
-    AsOfDate DATE
-);
\ No newline at end of file
+    AsOfDate DATE,
+    PRIMARY KEY (SourceCurrencyCode, TargetCurrencyCode, AsOfDate)
+);
+
+CREATE TABLE IF NOT EXISTS qbo_extract_watermarks (
+    realm_id TEXT,
+    entity TEXT,
+    last_updated_time TEXT,
+    PRIMARY KEY (realm_id, entity)
+);
+
+CREATE TABLE IF NOT EXISTS qbo_extract_fingerprints (
+    entity TEXT,
+    Id TEXT,
+    fingerprint TEXT,
+    PRIMARY KEY (entity, Id)
+);
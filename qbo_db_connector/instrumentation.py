@@ -0,0 +1,137 @@
+"""
+Stage timing instrumentation of the Quickbooks connectors
+"""
+import json
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+
+class StageObserver(ABC):
+    """
+    Interface of the observers passed to the connectors, notified at the end of every stage span
+    Span names are <entity>.<stage>, e.g. accounts.qbo_api, accounts.db_write or checks.build_payload
+    """
+    @abstractmethod
+    def on_span(self, name: str, duration: float, rows: int):
+        """
+        Called when a span ends
+        :param name: span name
+        :param duration: duration in seconds
+        :param rows: number of rows / records handled by the span
+        :return: None
+        """
+
+
+class Span:
+    """
+    Stage span, rows are set by the instrumented code
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.duration = 0.0
+
+
+@contextmanager
+def span(observers: List[StageObserver], name: str) -> Iterator[Span]:
+    """
+    Time a stage and notify the observers when it ends
+    :param observers: stage observers
+    :param name: span name
+    :return: Span to set the row count on
+    """
+    stage_span = Span(name)
+    start_time = time.perf_counter()
+
+    try:
+        yield stage_span
+    finally:
+        stage_span.duration = time.perf_counter() - start_time
+        for observer in observers:
+            observer.on_span(stage_span.name, stage_span.duration, stage_span.rows)
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    """
+    Nearest rank percentile
+    :param sorted_values: values in ascending order
+    :param percentile: percentile between 0 and 100
+    :return: percentile value
+    """
+    rank = max(1, int(math.ceil(percentile / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class StageTimingCollector(StageObserver):
+    """
+    Aggregates span durations and rows per span name
+    """
+    QUANTILES = [50, 95, 99]
+
+    def __init__(self):
+        self.__durations = {}
+        self.__rows = {}
+        self.__lock = threading.Lock()
+
+    def on_span(self, name: str, duration: float, rows: int):
+        with self.__lock:
+            self.__durations.setdefault(name, []).append(duration)
+            self.__rows[name] = self.__rows.get(name, 0) + rows
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Aggregate of every span name
+        :return: Dict of span name to count, rows, total, p50, p95 and p99 (in seconds)
+        """
+        with self.__lock:
+            durations = {name: sorted(values) for name, values in self.__durations.items()}
+            rows = dict(self.__rows)
+
+        summary = {}
+        for name in sorted(durations):
+            summary[name] = {
+                'count': len(durations[name]),
+                'rows': rows[name],
+                'total': sum(durations[name])
+            }
+            for quantile in self.QUANTILES:
+                summary[name]['p{0}'.format(quantile)] = _percentile(durations[name], quantile)
+
+        return summary
+
+    def to_json(self) -> str:
+        """
+        Summary as JSON
+        :return: JSON string
+        """
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Summary in the Prometheus text exposition format
+        :return: metrics text
+        """
+        lines = [
+            '# HELP qbo_connector_stage_duration_seconds Duration of Quickbooks connector stages.',
+            '# TYPE qbo_connector_stage_duration_seconds summary'
+        ]
+        summary = self.summary()
+
+        for name, stats in summary.items():
+            for quantile in self.QUANTILES:
+                lines.append('qbo_connector_stage_duration_seconds{{stage="{0}",quantile="{1}"}} {2}'.format(
+                    name, quantile / 100.0, stats['p{0}'.format(quantile)]
+                ))
+            lines.append('qbo_connector_stage_duration_seconds_sum{{stage="{0}"}} {1}'.format(name, stats['total']))
+            lines.append('qbo_connector_stage_duration_seconds_count{{stage="{0}"}} {1}'.format(name, stats['count']))
+
+        lines.append('# HELP qbo_connector_stage_rows_total Rows handled by Quickbooks connector stages.')
+        lines.append('# TYPE qbo_connector_stage_rows_total counter')
+        for name, stats in summary.items():
+            lines.append('qbo_connector_stage_rows_total{{stage="{0}"}} {1}'.format(name, stats['rows']))
+
+        return '\n'.join(lines) + '\n'
@@ -2,23 +2,90 @@
 QuickbooksLoadConnector(): Connection between Quickbooks and Database
 """
 from os import path
+import base64
+import hashlib
+import json
 import logging
-from typing import Dict, List
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Callable, ContextManager, Dict, Iterator, List, Tuple
 
-import pandas as pd
+from .instrumentation import Span, StageObserver, span
+from .rate_limiter import RateLimiter
+from .retry import CircuitBreaker, RetryPolicy, guarded
+from .uploads import MultipartUpload, base64_length, content_hash, content_type, encoded_bytes, encoded_file, \
+    encoded_text, file_chunks
 
-from qbosdk import QuickbooksOnlineSDK
+if TYPE_CHECKING:
+    from qbosdk import QuickbooksOnlineSDK
 
 logger = logging.getLogger('QuickbooksLoadConnector')
 
+# namespace of the deterministic requestids sent with the create requests
+REQUEST_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/fylein/qbo-db-connector')
+
+
+def _dict_row(cursor, row: tuple) -> Dict:
+    """
+    Row factory of the load connector cursors, rows as column name Dicts
+    :param cursor: cursor the row was fetched from
+    :param row: row tuple
+    :return: row Dict
+    """
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
 
 class QuickbooksLoadConnector:
     """
     Extract data from Database and load to Quickbooks
     """
-    def __init__(self, qbo_connection: QuickbooksOnlineSDK, dbconn):
+    BATCH_URL = '/batch?minorversion=38'
+
+    # create urls of the object types, the SDK post functions do not take a requestid
+    POST_URLS = {
+        'checks': '/purchase?minorversion=38',
+        'journal_entries': '/journalentry?minorversion=38',
+        'attachments': '/attachable?minorversion=38'
+    }
+
+    UPLOAD_URL = '/upload'
+    GET_ATTACHABLE_URL = '/attachable/{0}?minorversion=38'
+
+    # maximum number of operations Quickbooks accepts in a batch request
+    BATCH_SIZE = 30
+
+    # header table, line items table and line items foreign key of the object types
+    LOAD_TABLES = {
+        'checks': ('qbo_load_checks', 'qbo_load_check_lineitems', 'check_id'),
+        'journal_entries': ('qbo_load_journal_entries', 'qbo_load_journal_entry_lineitems', 'journal_entry_id')
+    }
+
+    # maximum number of ids bound in a single prefetch query, below the SQLite limit of 999 variables
+    PREFETCH_SIZE = 512
+
+    # number of results of a concurrent load buffered before they are written to qbo_load_state
+    STATE_FLUSH_SIZE = 100
+
+    def __init__(self, qbo_connection: 'QuickbooksOnlineSDK', dbconn, rate_limiter: RateLimiter = None,
+                 observers: List[StageObserver] = None, retry_policy: RetryPolicy = None,
+                 circuit_breaker: CircuitBreaker = None, realm_id: str = None):
+        """
+        :param qbo_connection: Quickbooks SDK connection
+        :param dbconn: database connection
+        :param rate_limiter: rate limiter of the realm
+        :param observers: stage observers
+        :param retry_policy: retry policy of transient Quickbooks failures
+        :param circuit_breaker: circuit breaker of the realm
+        :param realm_id: Quickbooks realm / company id, keys the Attachables of uploaded attachments
+        """
         self.__qbo_connection = qbo_connection
         self.__dbconn = dbconn
+        self.__realm_id = realm_id if realm_id else ''
+        self.__rate_limiter = rate_limiter
+        self.__observers = observers if observers else []
+        self.__retry_policy = retry_policy
+        self.__circuit_breaker = circuit_breaker
 
     def create_tables(self):
         """
@@ -30,6 +97,198 @@ class QuickbooksLoadConnector:
         ddl_sql = open(ddl_path, 'r').read()
         self.__dbconn.executescript(ddl_sql)
 
+    def __span(self, object_type: str, stage: str) -> ContextManager[Span]:
+        """
+        Time a stage of a load and report it to the observers as <object_type>.<stage>
+        :param object_type: checks, journal_entries or attachments
+        :param stage: db_read, build_payload or qbo_api
+        :return: span context manager
+        """
+        return span(self.__observers, '{0}.{1}'.format(object_type, stage))
+
+    def __select_dicts(self, sql: str, parameters: List = ()) -> List[Dict]:
+        """
+        Run a select on dbconn, returning rows as column name Dicts whatever the row_factory of dbconn
+        Statements only take bound parameters, so that their SQL text is constant and dbconn can reuse
+        the prepared statement (sqlite3 caches them per connection)
+        :param sql: select statement
+        :param parameters: bound parameters of the statement
+        :return: List of rows
+        """
+        cursor = self.__dbconn.cursor()
+        cursor.row_factory = _dict_row
+        return cursor.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def __in_parameters(values: List) -> (str, List):
+        """
+        Placeholders and parameters of an in (...) list, padded with NULLs to the next power of two
+        so that lists of similar lengths share a prepared statement
+        :param values: values of the list
+        :return: placeholders and parameters
+        """
+        size = 1
+        while size < len(values):
+            size = size * 2
+
+        return ', '.join('?' * size), list(values) + [None] * (size - len(values))
+
+    def __read_rows(self, object_type: str, object_ids: List[str]) -> Dict[str, Tuple[Dict, List[Dict]]]:
+        """
+        Read the headers and line items of many objects, in two indexed queries per PREFETCH_SIZE ids
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids
+        :return: Dict of source id to its header and line items, ids missing from Database are left out
+        """
+        header_table, line_items_table, foreign_key = self.LOAD_TABLES[object_type]
+        rows = {}
+
+        with self.__span(object_type, 'db_read') as stage_span:
+            for start in range(0, len(object_ids), self.PREFETCH_SIZE):
+                placeholders, parameters = self.__in_parameters(object_ids[start:start + self.PREFETCH_SIZE])
+
+                headers = self.__select_dicts(
+                    'SELECT * FROM {0} where id in ({1})'.format(header_table, placeholders), parameters
+                )
+                for header in headers:
+                    rows.setdefault(header['id'], (header, []))
+
+                line_items = self.__select_dicts(
+                    'SELECT * FROM {0} where {1} in ({2})'.format(line_items_table, foreign_key, placeholders),
+                    parameters
+                )
+                for line_item in line_items:
+                    if line_item[foreign_key] in rows:
+                        rows[line_item[foreign_key]][1].append(line_item)
+
+                stage_span.rows = stage_span.rows + len(headers) + len(line_items)
+
+        return rows
+
+    def __prefetched(self, object_type: str, object_ids: List[str]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Iterate over source ids along with their prefetched rows, reading PREFETCH_SIZE ids at a time
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids
+        :return: Iterator of (source id, rows Dict of its prefetch chunk)
+        """
+        object_ids = list(dict.fromkeys(object_ids))
+
+        for start in range(0, len(object_ids), self.PREFETCH_SIZE):
+            chunk_ids = object_ids[start:start + self.PREFETCH_SIZE]
+            rows = self.__read_rows(object_type, chunk_ids)
+
+            for object_id in chunk_ids:
+                yield object_id, rows
+
+    def load_states(self, object_type: str, object_ids: List[str] = None) -> List[Dict]:
+        """
+        Get the load state of objects, as recorded in qbo_load_state
+        Status is pending once a bulk load is about to post the object, then success or failed
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids, None for all objects of the type
+        :return: List of state Dicts with source_id, status, qbo_id, url, error and updated_at
+        """
+        sql = 'select source_id, status, qbo_id, url, error, updated_at from qbo_load_state where object_type = ?'
+        if object_ids is None:
+            return self.__select_dicts(sql, (object_type,))
+
+        states = []
+        for start in range(0, len(object_ids), self.PREFETCH_SIZE):
+            placeholders, parameters = self.__in_parameters(object_ids[start:start + self.PREFETCH_SIZE])
+            states.extend(self.__select_dicts(
+                '{0} and source_id in ({1})'.format(sql, placeholders), [object_type] + parameters
+            ))
+
+        return states
+
+    def __succeeded(self, object_type: str, object_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Results of the objects already loaded by a previous run
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids
+        :return: Dict of source id to a skipped result, with the Quickbooks id and url of the object
+        """
+        return {
+            state['source_id']: {
+                'success': True,
+                'skipped': True,
+                'response': {'id': state['qbo_id'], 'url': state['url']}
+            }
+            for state in self.load_states(object_type, object_ids) if state['status'] == 'success'
+        }
+
+    def __save_states(self, object_type: str, results: List[Tuple[str, Dict or None]]):
+        """
+        Record the load state of objects in qbo_load_state, in a single statement
+        :param object_type: checks or journal_entries
+        :param results: (source id, result) pairs, a None result records the object as pending
+        :return: None
+        """
+        updated_at = datetime.now(timezone.utc).isoformat()
+        states = []
+
+        for object_id, result in results:
+            if result is None:
+                states.append((object_type, object_id, 'pending', None, None, None, updated_at))
+            elif result['success']:
+                states.append((
+                    object_type, object_id, 'success', result['response']['id'], result['response']['url'], None,
+                    updated_at
+                ))
+            else:
+                error = result['error'] if isinstance(result['error'], str) else json.dumps(result['error'])
+                states.append((object_type, object_id, 'failed', None, None, error, updated_at))
+
+        if states:
+            self.__dbconn.executemany(
+                'insert or replace into qbo_load_state (object_type, source_id, status, qbo_id, url, error, '
+                'updated_at) values (?, ?, ?, ?, ?, ?, ?)',
+                states
+            )
+            self.__dbconn.commit()
+
+    def __call_qbo(self, object_type: str, function: Callable, *args, **kwargs):
+        """
+        Call a Quickbooks SDK function through the retry policy, circuit breaker and rate limiter of the connector
+        :param object_type: object type the call is made for, names the qbo_api span
+        :param function: SDK function, e.g. self.__qbo_connection.purchases.post
+        :return: return value of the function
+        """
+        with self.__span(object_type, 'qbo_api') as stage_span:
+            stage_span.rows = 1
+            return guarded(function, self.__retry_policy, self.__circuit_breaker, self.__rate_limiter)(*args, **kwargs)
+
+    @staticmethod
+    def request_id(object_type: str, source_id: str, payload: Dict) -> str:
+        """
+        Deterministic Quickbooks requestid of a create request, derived from the source id and the payload hash
+        Quickbooks answers a request carrying an already processed requestid with the original response instead
+        of creating the object again, so a post retried after a timeout cannot create a duplicate.
+        A changed payload, e.g. a custom doc number, gets a new requestid
+        :param object_type: checks, journal_entries or the object type of a batch
+        :param source_id: source id, or the joined bIds of a batch
+        :param payload: request body
+        :return: requestid, a uuid
+        """
+        payload_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return str(uuid.uuid5(REQUEST_ID_NAMESPACE, '{0}/{1}/{2}'.format(object_type, source_id, payload_hash)))
+
+    def __post(self, object_type: str, sdk_api, source_id: str, payload: Dict, url: str) -> Dict:
+        """
+        Post a create request to Quickbooks with its deterministic requestid, retries of the post are idempotent
+        :param object_type: checks or journal_entries
+        :param sdk_api: SDK api of the object type, e.g. self.__qbo_connection.purchases
+        :param source_id: source id, or the joined bIds of a batch
+        :param payload: request body
+        :param url: create url, with its minorversion query parameter
+        :return: Quickbooks response Dict
+        """
+        url = '{0}&requestid={1}'.format(url, self.request_id(object_type, source_id, payload))
+
+        # pylint: disable=protected-access
+        return self.__call_qbo(object_type, sdk_api._post_request, payload, url)
+
     @staticmethod
     def __construct_check_line_items(check_line_items: List[Dict]) -> List[Dict]:
         """
@@ -89,6 +348,47 @@ class QuickbooksLoadConnector:
 
         return qbo_load_check
 
+    def __prepare_check(self, check_id: str, rows: Dict = None, custom_transaction_date: str = None,
+                        custom_private_note: str = None, custom_doc_number: str = None) -> (Dict, Dict):
+        """
+        Build the Quickbooks payload of a check
+        :param check_id: Check id to be loaded
+        :param rows: prefetched rows containing the check, read from Database if not given
+        :return: check row and Purchase payload
+        """
+        rows = rows if rows is not None else self.__read_rows('checks', [check_id])
+        assert check_id in rows, 'check {0} does not exist stopping export'.format(check_id)
+
+        check, check_line_items = rows[check_id]
+
+        assert check_line_items, 'check line items do not exists stopping export'
+
+        with self.__span('checks', 'build_payload') as stage_span:
+            qbo_load_check: Dict = self.__construct_check(check, custom_transaction_date,
+                                                          custom_private_note, custom_doc_number)
+
+            lines = self.__construct_check_line_items(check_line_items)
+            qbo_load_check['Line'] = lines
+            stage_span.rows = len(lines)
+
+        return check, qbo_load_check
+
+    def __loaded_check(self, check: Dict, purchase: Dict) -> Dict:
+        """
+        Loaded check details
+        :param check: check row
+        :param purchase: Purchase created by Quickbooks
+        :return: loaded check Dict
+        """
+        return {
+            'id': purchase['Id'],
+            'url': '{0}/app/check?txnId={1}'.format(self.__qbo_connection.web_app_url, purchase['Id']),
+            'entity': check['employee_email'],
+            'record_date': check['record_date'],
+            'department': check['department'],
+            'amount': purchase['TotalAmt']
+        }
+
     def load_check(self, check_id: str, custom_transaction_date: str = None,
                    custom_private_note: str = None, custom_doc_number: str = None) -> (bool, Dict):
         """
@@ -101,36 +401,29 @@ class QuickbooksLoadConnector:
         """
         logger.info('Loading checks in to Quickbooks.')
 
-        check: Dict = pd.read_sql_query(
-            sql="SELECT * FROM qbo_load_checks where id = '{0}'".format(check_id),
-            con=self.__dbconn
-        ).to_dict(orient='records')[0]
-
-        qbo_load_check: Dict = self.__construct_check(check, custom_transaction_date,
-                                                      custom_private_note, custom_doc_number)
-
-        check_line_items: List[Dict] = pd.read_sql_query(
-            sql="SELECT * FROM qbo_load_check_lineitems where check_id = '{0}'".format(check_id),
-            con=self.__dbconn).to_dict(orient='records')
-
-        assert check_line_items, 'check line items do not exists stopping export'
-
-        lines = self.__construct_check_line_items(check_line_items)
-        qbo_load_check['Line'] = lines
+        check, qbo_load_check = self.__prepare_check(
+            check_id, None, custom_transaction_date, custom_private_note, custom_doc_number
+        )
 
-        response = self.__qbo_connection.purchases.post(qbo_load_check)
+        response = self.__post('checks', self.__qbo_connection.purchases, check_id, qbo_load_check,
+                               self.POST_URLS['checks'])
 
-        loaded_check: Dict = {
-            'id': response['Purchase']['Id'],
-            'url': '{0}/app/check?txnId={1}'.format(self.__qbo_connection.web_app_url, response['Purchase']['Id']),
-            'entity': check['employee_email'],
-            'record_date': check['record_date'],
-            'department': check['department'],
-            'amount': response['Purchase']['TotalAmt']
-        }
+        loaded_check: Dict = self.__loaded_check(check, response['Purchase'])
         logger.info('Check with id %s created against expenses', response['Purchase']['Id'])
         return loaded_check
 
+    def load_checks(self, check_ids: List[str], batch_size: int = BATCH_SIZE) -> Dict[str, Dict]:
+        """
+        Load many checks to Quickbooks, packing up to batch_size of them in each batch request
+        Checks loaded by a previous run are skipped, results are recorded in qbo_load_state
+        :param check_ids: Check ids to be loaded
+        :param batch_size: operations per batch request, at most 30
+        :return: Dict of check id to its result, with success and either response (loaded check) or error
+        """
+        logger.info('Loading %s checks in to Quickbooks in batches.', len(check_ids))
+
+        return self.__load_batches('checks', check_ids, batch_size)
+
     @staticmethod
     def __construct_journal_entry_line_items(journal_entry_line_items: List[Dict]) -> List[Dict]:
         """
@@ -189,6 +482,50 @@ class QuickbooksLoadConnector:
 
         return qbo_load_journal_entry
 
+    def __prepare_journal_entry(self, journal_entry_id: str, rows: Dict = None, custom_transaction_date: str = None,
+                                custom_private_note: str = None, custom_doc_number: str = None) -> (Dict, Dict):
+        """
+        Build the Quickbooks payload of a journal entry
+        :param journal_entry_id: Journal Entry unique id
+        :param rows: prefetched rows containing the journal entry, read from Database if not given
+        :return: journal entry row and JournalEntry payload
+        """
+        rows = rows if rows is not None else self.__read_rows('journal_entries', [journal_entry_id])
+        assert journal_entry_id in rows, 'journal entry {0} does not exist stopping export'.format(journal_entry_id)
+
+        journal_entry, journal_entry_line_items = rows[journal_entry_id]
+
+        assert journal_entry_line_items, 'check line items do not exists stopping export'
+
+        with self.__span('journal_entries', 'build_payload') as stage_span:
+            qbo_load_journal_entry: Dict = self.__construct_journal_entry(
+                journal_entry=journal_entry, custom_transaction_date=custom_transaction_date,
+                custom_private_note=custom_private_note, custom_doc_number=custom_doc_number
+            )
+
+            qbo_load_journal_entry_line_items: List[Dict] = self.__construct_journal_entry_line_items(
+                journal_entry_line_items
+            )
+            qbo_load_journal_entry['Line'] = qbo_load_journal_entry_line_items
+            stage_span.rows = len(qbo_load_journal_entry_line_items)
+
+        return journal_entry, qbo_load_journal_entry
+
+    def __loaded_journal_entry(self, journal_entry: Dict, qbo_journal_entry: Dict) -> Dict:
+        """
+        Loaded journal entry details
+        :param journal_entry: journal entry row
+        :param qbo_journal_entry: JournalEntry created by Quickbooks
+        :return: loaded journal entry Dict
+        """
+        return {
+            'id': qbo_journal_entry['Id'],
+            'url': '{0}/app/journal?txnId={1}'.format(self.__qbo_connection.web_app_url, qbo_journal_entry['Id']),
+            'entity': journal_entry['employee_email'],
+            'record_date': journal_entry['record_date'],
+            'amount': qbo_journal_entry['TotalAmt']
+        }
+
     def load_journal_entry(self, journal_entry_id: str, custom_transaction_date: str = None,
                            custom_private_note: str = None, custom_doc_number: str = None):
         """
@@ -201,67 +538,436 @@ class QuickbooksLoadConnector:
         """
         logger.info('Loading journal entries in to Quickbooks.')
 
-        journal_entry: Dict = pd.read_sql_query(
-            sql="SELECT * FROM qbo_load_journal_entries where id = '{0}'".format(journal_entry_id),
-            con=self.__dbconn
-        ).to_dict(orient='records')[0]
-
-        qbo_load_journal_entry: Dict = self.__construct_journal_entry(
-            journal_entry=journal_entry, custom_transaction_date=custom_transaction_date,
-            custom_private_note=custom_private_note, custom_doc_number=custom_doc_number
+        journal_entry, qbo_load_journal_entry = self.__prepare_journal_entry(
+            journal_entry_id, None, custom_transaction_date, custom_private_note, custom_doc_number
         )
 
-        journal_entry_line_items: List[Dict] = pd.read_sql_query(
-            sql="SELECT * FROM qbo_load_journal_entry_lineitems where journal_entry_id = '{0}'".format(
-                journal_entry_id),
-            con=self.__dbconn
-        ).to_dict(orient='records')
+        response = self.__post('journal_entries', self.__qbo_connection.journal_entries, journal_entry_id,
+                               qbo_load_journal_entry, self.POST_URLS['journal_entries'])
 
-        assert journal_entry_line_items, 'check line items do not exists stopping export'
+        loaded_journal_entry: Dict = self.__loaded_journal_entry(journal_entry, response['JournalEntry'])
+
+        logger.info('Journal Entry with id %s created', response['JournalEntry']['Id'])
+        return loaded_journal_entry
+
+    def load_journal_entries(self, journal_entry_ids: List[str], batch_size: int = BATCH_SIZE) -> Dict[str, Dict]:
+        """
+        Load many journal entries to Quickbooks, packing up to batch_size of them in each batch request
+        Journal entries loaded by a previous run are skipped, results are recorded in qbo_load_state
+        :param journal_entry_ids: Journal Entry unique ids
+        :param batch_size: operations per batch request, at most 30
+        :return: Dict of journal entry id to its result, with success and either response (loaded journal entry)
+                 or error
+        """
+        logger.info('Loading %s journal entries in to Quickbooks in batches.', len(journal_entry_ids))
+
+        return self.__load_batches('journal_entries', journal_entry_ids, batch_size)
+
+    def __loader(self, object_type: str) -> (str, object, Callable, Callable):
+        """
+        Quickbooks object type, SDK api and payload / result builders of an object type loaded in bulk
+        :param object_type: checks or journal_entries
+        :return: Quickbooks object type, SDK api, prepare function and loaded function
+        """
+        loaders = {
+            'checks': ('Purchase', self.__qbo_connection.purchases, self.__prepare_check, self.__loaded_check),
+            'journal_entries': (
+                'JournalEntry', self.__qbo_connection.journal_entries,
+                self.__prepare_journal_entry, self.__loaded_journal_entry
+            )
+        }
+        assert object_type in loaders, '{0} cannot be loaded in bulk'.format(object_type)
+
+        return loaders[object_type]
+
+    def __load_batches(self, object_type: str, object_ids: List[str], batch_size: int) -> Dict[str, Dict]:
+        """
+        Create objects through Quickbooks batch requests, keyed on the source ids (bId)
+        Objects are read, prepared and posted PREFETCH_SIZE at a time, so that memory stays bounded and the
+        first batches are posted before all rows are read. A failure to prepare an object, a fault on its batch
+        item or a failed batch request only fails the objects concerned. Objects that already succeeded are
+        skipped, the others are recorded as pending before the first request and their results are written
+        to qbo_load_state after every batch
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids
+        :param batch_size: operations per batch request, at most 30
+        :return: Dict of source id to its result, with success and either response or error
+        """
+        assert 0 < batch_size <= self.BATCH_SIZE, 'batch size must be between 1 and {0}'.format(self.BATCH_SIZE)
+
+        results = self.__succeeded(object_type, object_ids)
+        pending_ids = [object_id for object_id in dict.fromkeys(object_ids) if object_id not in results]
+
+        logger.info('%s %s already loaded, skipped.', len(results), object_type)
+        self.__save_states(object_type, [(object_id, None) for object_id in pending_ids])
+
+        for start in range(0, len(pending_ids), self.PREFETCH_SIZE):
+            results.update(
+                self.__load_batch_chunk(object_type, pending_ids[start:start + self.PREFETCH_SIZE], batch_size)
+            )
+
+        return {object_id: results[object_id] for object_id in dict.fromkeys(object_ids)}
+
+    def __load_batch_chunk(self, object_type: str, object_ids: List[str], batch_size: int) -> Dict[str, Dict]:
+        """
+        Read and prepare a prefetch chunk of objects, then post them in batch requests
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids of the chunk, at most PREFETCH_SIZE
+        :param batch_size: operations per batch request
+        :return: Dict of source id to its result
+        """
+        _, _, prepare, _ = self.__loader(object_type)
+        rows = self.__read_rows(object_type, object_ids)
+        prepared = {}
+        results = {}
+
+        for object_id in object_ids:
+            try:
+                prepared[object_id] = prepare(object_id, rows)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error('%s %s could not be prepared: %r', object_type, object_id, error)
+                results[object_id] = {'success': False, 'error': repr(error)}
+
+        self.__save_states(object_type, list(results.items()))
+
+        prepared_ids = list(prepared)
+        for start in range(0, len(prepared_ids), batch_size):
+            batch = {object_id: prepared[object_id] for object_id in prepared_ids[start:start + batch_size]}
+            results.update(self.__post_batch(object_type, batch))
+
+        return results
+
+    def __post_batch(self, object_type: str, batch: Dict[str, Tuple[Dict, Dict]]) -> Dict[str, Dict]:
+        """
+        Post a Quickbooks batch request and record the result of every batch item
+        :param object_type: checks or journal_entries
+        :param batch: Dict of source id to its row and payload, at most BATCH_SIZE
+        :return: Dict of source id to its result
+        """
+        qbo_object_type, sdk_api, _, loaded = self.__loader(object_type)
+        batch_request = {
+            'BatchItemRequest': [
+                {'bId': object_id, 'operation': 'create', qbo_object_type: payload}
+                for object_id, (_, payload) in batch.items()
+            ]
+        }
+
+        try:
+            response = self.__post(object_type, sdk_api, ','.join(batch), batch_request, self.BATCH_URL)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error('Batch of %s %s failed: %r', len(batch), object_type, error)
+            results = {object_id: {'success': False, 'error': repr(error)} for object_id in batch}
+        else:
+            batch_items = {item.get('bId'): item for item in response.get('BatchItemResponse', [])}
+            results = {}
+            for object_id, (row, _) in batch.items():
+                batch_item = batch_items.get(object_id, {})
+                if qbo_object_type in batch_item:
+                    results[object_id] = {'success': True, 'response': loaded(row, batch_item[qbo_object_type])}
+                else:
+                    results[object_id] = {'success': False, 'error': batch_item.get('Fault', 'no batch item response')}
+            logger.info('Batch of %s %s loaded.', len(batch), object_type)
+
+        self.__save_states(object_type, list(results.items()))
+        return results
+
+    def load_concurrently(self, object_type: str, object_ids: List[str],
+                          max_workers: int = 4) -> Iterator[Tuple[str, Dict]]:
+        """
+        Load many checks or journal entries to Quickbooks, posting up to max_workers of them at a time
+        Rows are read and payloads built on the calling thread, as dbconn may not be shared across threads,
+        while the posts run on a bounded pool. A failing object does not stop the others
+        Objects loaded by a previous run are skipped, the others are recorded as pending before the first post
+        and their results are written to qbo_load_state every STATE_FLUSH_SIZE results
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids
+        :param max_workers: maximum number of concurrent Quickbooks calls
+        :return: Iterator of (source id, result), skipped objects first and then in completion order, the result
+                 has success and either response (loaded object) or error
+        """
+        skipped = self.__succeeded(object_type, object_ids)
+        pending_ids = [object_id for object_id in dict.fromkeys(object_ids) if object_id not in skipped]
+
+        logger.info('%s %s already loaded, skipped.', len(skipped), object_type)
+        yield from skipped.items()
+
+        self.__save_states(object_type, [(object_id, None) for object_id in pending_ids])
+
+        results = []
+        try:
+            for object_id, result in self.__load_concurrently(object_type, pending_ids, max_workers):
+                results.append((object_id, result))
+                if len(results) >= self.STATE_FLUSH_SIZE:
+                    self.__save_states(object_type, results)
+                    results = []
+
+                yield object_id, result
+        finally:
+            self.__save_states(object_type, results)
+
+    def __load_concurrently(self, object_type: str, object_ids: List[str],
+                            max_workers: int) -> Iterator[Tuple[str, Dict]]:
+        """
+        Load objects to Quickbooks on a bounded pool of threads
+        :param object_type: checks or journal_entries
+        :param object_ids: source ids
+        :param max_workers: maximum number of concurrent Quickbooks calls
+        :return: Iterator of (source id, result) in completion order
+        """
+        _, _, prepare, _ = self.__loader(object_type)
+        prefetched = self.__prefetched(object_type, object_ids)
+        exhausted = False
+        futures = {}
+
+        logger.info('Loading %s in to Quickbooks with %s workers.', object_type, max_workers)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while futures or not exhausted:
+                # keep the pool busy, with at most one prepared payload waiting per worker
+                while not exhausted and len(futures) < 2 * max_workers:
+                    object_id, rows = next(prefetched, (None, None))
+                    if object_id is None:
+                        exhausted = True
+                        break
+
+                    try:
+                        row, payload = prepare(object_id, rows)
+                    except Exception as error:  # pylint: disable=broad-except
+                        logger.error('%s %s could not be prepared: %r', object_type, object_id, error)
+                        yield object_id, {'success': False, 'error': repr(error)}
+                        continue
+
+                    futures[executor.submit(self.__load_one, object_type, object_id, row, payload)] = object_id
+
+                if not futures:
+                    continue
+
+                for future in wait(futures, return_when=FIRST_COMPLETED).done:
+                    object_id = futures.pop(future)
+                    try:
+                        yield object_id, {'success': True, 'response': future.result()}
+                    except Exception as error:  # pylint: disable=broad-except
+                        logger.error('%s %s could not be loaded: %r', object_type, object_id, error)
+                        yield object_id, {'success': False, 'error': repr(error)}
+
+    def __load_one(self, object_type: str, object_id: str, row: Dict, payload: Dict) -> Dict:
+        """
+        Post a prepared object to Quickbooks, runs on the pool of load_concurrently
+        :param object_type: checks or journal_entries
+        :param object_id: source id
+        :param row: header row of the object
+        :param payload: Quickbooks payload of the object
+        :return: loaded object Dict
+        """
+        qbo_object_type, sdk_api, _, loaded = self.__loader(object_type)
+        response = self.__post(object_type, sdk_api, object_id, payload, self.POST_URLS[object_type])
 
-        qbo_load_journal_entry_line_items: List[Dict] = self.__construct_journal_entry_line_items(
-            journal_entry_line_items
+        return loaded(row, response[qbo_object_type])
+
+    @staticmethod
+    def __attachment_upload(attachment: Dict) -> MultipartUpload:
+        """
+        Streamed upload body of an attachment, its content read from file_path, content_blob or the base64 content
+        :param attachment: qbo_load_attachments row
+        :return: multipart body
+        """
+        file_content_type = content_type(attachment['filename'])
+
+        if attachment['file_path']:
+            file_path = attachment['file_path']
+            return MultipartUpload(attachment['filename'], file_content_type, lambda: encoded_file(file_path),
+                                   base64_length(path.getsize(file_path)))
+
+        if attachment['content_blob'] is not None:
+            content_blob = attachment['content_blob']
+            return MultipartUpload(attachment['filename'], file_content_type, lambda: encoded_bytes(content_blob),
+                                   base64_length(len(content_blob)))
+
+        content = attachment['content'] or ''
+        return MultipartUpload(attachment['filename'], file_content_type, lambda: encoded_text(content),
+                               len(content))
+
+    def __load_attachment(self, ref_id: str, ref_type: str, attachment: Dict) -> Dict:
+        """
+        Upload an attachment and link it to an object, the upload body is rebuilt for every attempt
+        :param ref_id: object id
+        :param ref_type: type of object
+        :param attachment: qbo_load_attachments row
+        :return: Attachable response Dict
+        """
+        attachments_api = self.__qbo_connection.attachments
+
+        # pylint: disable=protected-access
+        attachable = self.__call_qbo(
+            'attachments', lambda: attachments_api._post_file(self.__attachment_upload(attachment), self.UPLOAD_URL)
         )
-        qbo_load_journal_entry['Line'] = qbo_load_journal_entry_line_items
+        attachable['AttachableRef'] = [{'EntityRef': {'type': ref_type, 'value': ref_id}}]
 
-        response = self.__qbo_connection.journal_entries.post(qbo_load_journal_entry)
+        return self.__post('attachments', attachments_api, ref_id, attachable, self.POST_URLS['attachments'])
 
-        loaded_journal_entry: Dict = {
-            'id': response['JournalEntry']['Id'],
-            'url': '{0}/app/journal?txnId={1}'.format(self.__qbo_connection.web_app_url,
-                                                      response['JournalEntry']['Id']),
-            'entity': journal_entry['employee_email'],
-            'record_date': journal_entry['record_date'],
-            'amount': response['JournalEntry']['TotalAmt']
+    @staticmethod
+    def __attachment_hash(attachment: Dict) -> str:
+        """
+        Hash of the raw content of an attachment, the same whether it is stored in file_path, content_blob or content
+        :param attachment: qbo_load_attachments row
+        :return: content hash
+        """
+        if attachment['file_path']:
+            return content_hash(file_chunks(attachment['file_path']))
+
+        if attachment['content_blob'] is not None:
+            return content_hash([attachment['content_blob']])
+
+        return content_hash([base64.b64decode(attachment['content'] or '')])
+
+    def __uploaded_attachable_id(self, attachment_hash: str) -> str or None:
+        """
+        Attachable created by a previous upload of the same content in the realm
+        :param attachment_hash: content hash
+        :return: Attachable id or None
+        """
+        uploads = self.__select_dicts(
+            'select attachable_id from qbo_attachment_uploads where realm_id = ? and content_hash = ?',
+            (self.__realm_id, attachment_hash)
+        )
+        return uploads[0]['attachable_id'] if uploads else None
+
+    def __link_attachable(self, ref_id: str, ref_type: str, attachable_id: str, attachment: Dict) -> Dict:
+        """
+        Link an already uploaded Attachable to one more object, with a sparse update of its AttachableRef
+        The attachment is uploaded again if the Attachable no longer exists in Quickbooks
+        :param ref_id: object id
+        :param ref_type: type of object
+        :param attachable_id: Attachable id
+        :param attachment: qbo_load_attachments row
+        :return: Attachable response Dict
+        """
+        attachments_api = self.__qbo_connection.attachments
+
+        try:
+            # pylint: disable=protected-access
+            attachable = self.__call_qbo(
+                'attachments', attachments_api._get_request, 'Attachable', self.GET_ATTACHABLE_URL.format(attachable_id)
+            )
+        except Exception as error:
+            # pylint: disable=import-outside-toplevel,no-member
+            from qbosdk.exceptions import NotFoundItemError, WrongParamsError
+
+            # Quickbooks often reports a deleted Attachable as a 400 Object Not Found fault rather than a 404
+            if not isinstance(error, NotFoundItemError) and not (
+                    isinstance(error, WrongParamsError) and 'Object Not Found' in str(error.response)):
+                raise
+            logger.warning('Attachable %s not found, uploading %s again.', attachable_id, attachment['filename'])
+            return self.__load_attachment(ref_id, ref_type, attachment)
+
+        attachable_refs = attachable.get('AttachableRef', [])
+        entity_ref = {'type': ref_type, 'value': ref_id}
+        if any(attachable_ref.get('EntityRef') == entity_ref for attachable_ref in attachable_refs):
+            return {'Attachable': attachable}
+
+        sparse_attachable = {
+            'Id': attachable['Id'],
+            'SyncToken': attachable['SyncToken'],
+            'sparse': True,
+            'AttachableRef': attachable_refs + [{'EntityRef': entity_ref}]
         }
+        return self.__post('attachments', attachments_api, ref_id, sparse_attachable, self.POST_URLS['attachments'])
 
-        logger.info('Journal Entry with id %s created', response['JournalEntry']['Id'])
-        return loaded_journal_entry
+    def __collect_attachments(self, futures: Dict, done, responses: Dict, uploading: Dict):
+        """
+        Record the responses of completed attachment loads, and the Attachable of their content
+        :param futures: Dict of future to (row index, content hash, file name), completed futures are removed
+        :param done: completed futures
+        :param responses: Dict of row index to response
+        :param uploading: Dict of content hash to the future uploading or linking it
+        :return: None
+        """
+        for future in done:
+            index, attachment_hash, file_name = futures.pop(future)
+            if uploading.get(attachment_hash) is future:
+                del uploading[attachment_hash]
+
+            responses[index] = future.result()
+            self.__dbconn.execute(
+                'insert or replace into qbo_attachment_uploads (realm_id, content_hash, attachable_id, filename, '
+                'updated_at) values (?, ?, ?, ?, ?)',
+                (self.__realm_id, attachment_hash, responses[index]['Attachable']['Id'], file_name,
+                 datetime.now(timezone.utc).isoformat())
+            )
+
+    def __attachment_rows(self, prep_id: str, ref_type: str) -> Iterator[Dict]:
+        """
+        Read the qbo_load_attachments rows of an object one at a time, skipping unsupported file types
+        :param prep_id: prep id for export
+        :param ref_type: type of object
+        :return: Iterator of qbo_load_attachments rows
+        """
+        cursor = self.__dbconn.cursor()
+        cursor.row_factory = _dict_row
+        cursor.execute(
+            'select filename, file_path, content_blob, content from qbo_load_attachments '
+            'where prep_id = ? and ref_type = ?',
+            (prep_id, ref_type)
+        )
+
+        while True:
+            with self.__span('attachments', 'db_read') as stage_span:
+                attachment = cursor.fetchone()
+                stage_span.rows = 1 if attachment else 0
 
-    def load_attachments(self, ref_id: str, ref_type: str, prep_id: str) -> List:
+            if attachment is None:
+                return
+
+            if not content_type(attachment['filename']):
+                logger.warning('Attachment %s has an unsupported file type, skipped.', attachment['filename'])
+                continue
+
+            yield attachment
+
+    def load_attachments(self, ref_id: str, ref_type: str, prep_id: str, max_workers: int = 4) -> List:
         """
         Link attachments to objects Quickbooks
+        Rows are read one at a time and their content is base64 encoded while it is uploaded, from file_path,
+        content_blob or content (already base64) in this order. At most max_workers attachments are held
+        in memory and uploaded at a time. Content already uploaded to the realm, as recorded by its hash in
+        qbo_attachment_uploads, is not uploaded again: its Attachable is linked to the object instead
         :param prep_id: prep id for export
         :param ref_id: object id
         :param ref_type: type of object
-        :return: True for success, False for failure
+        :param max_workers: maximum number of concurrent uploads
+        :return: List of Attachable responses, in row order
         """
-        attachments = pd.read_sql_query(
-            "select * from qbo_load_attachments where prep_id = '{0}' and ref_type = '{1}'".format(prep_id, ref_type),
-            self.__dbconn
-        )
-
         logger.info('Loading attachments to QBO')
 
-        if len(attachments.index):
-            responses = []
-            for attachment in attachments.to_dict(orient='records'):
-                response = self.__qbo_connection.attachments.post(
-                    ref_id=ref_id,
-                    ref_type=ref_type,
-                    content=attachment['content'],
-                    file_name=attachment['filename']
-                )
-                responses.append(response)
-            return responses
-        return []
+        responses = {}
+        futures = {}
+        uploading = {}
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for index, attachment in enumerate(self.__attachment_rows(prep_id, ref_type)):
+                    attachment_hash = self.__attachment_hash(attachment)
+                    if attachment_hash in uploading:
+                        # the same content is being uploaded or linked, link to its Attachable once that is done,
+                        # with its new SyncToken or its Id if it had to be uploaded again
+                        self.__collect_attachments(futures, [uploading[attachment_hash]], responses, uploading)
+
+                    attachable_id = self.__uploaded_attachable_id(attachment_hash)
+                    if attachable_id:
+                        future = executor.submit(self.__link_attachable, ref_id, ref_type, attachable_id, attachment)
+                    else:
+                        future = executor.submit(self.__load_attachment, ref_id, ref_type, attachment)
+                    uploading[attachment_hash] = future
+
+                    futures[future] = (index, attachment_hash, attachment['filename'])
+
+                    if len(futures) >= max_workers:
+                        self.__collect_attachments(
+                            futures, wait(futures, return_when=FIRST_COMPLETED).done, responses, uploading
+                        )
+
+                self.__collect_attachments(futures, list(futures), responses, uploading)
+        finally:
+            self.__dbconn.commit()
+
+        return [responses[index] for index in sorted(responses)]
@@ -50,5 +50,32 @@ CREATE TABLE qbo_load_attachments (
     prep_id TEXT,
     ref_type TEXT,
     content TEXT,
-    filename TEXT
-);
\ No newline at end of file
+    filename TEXT,
+    content_blob BLOB,
+    file_path TEXT
+);
+
+CREATE INDEX qbo_load_journal_entries_id ON qbo_load_journal_entries (id);
+CREATE INDEX qbo_load_journal_entry_lineitems_journal_entry_id ON qbo_load_journal_entry_lineitems (journal_entry_id);
+CREATE INDEX qbo_load_checks_id ON qbo_load_checks (id);
+CREATE INDEX qbo_load_check_lineitems_check_id ON qbo_load_check_lineitems (check_id);
+
+CREATE TABLE IF NOT EXISTS qbo_load_state (
+    object_type TEXT,
+    source_id TEXT,
+    status TEXT,
+    qbo_id TEXT,
+    url TEXT,
+    error TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (object_type, source_id)
+);
+
+CREATE TABLE IF NOT EXISTS qbo_attachment_uploads (
+    realm_id TEXT,
+    content_hash TEXT,
+    attachable_id TEXT,
+    filename TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (realm_id, content_hash)
+);
@@ -0,0 +1,137 @@
+"""
+RateLimiter(): Per realm rate limiting of Quickbooks calls
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger('QuickbooksRateLimiter')
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Token bucket and concurrency semaphore for the Quickbooks calls of a realm
+    Quickbooks throttles a realm at about 500 requests per minute and 10 concurrent requests
+    """
+    def __init__(self, requests_per_minute: int = 500, max_concurrent: int = 10, burst: int = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        :param requests_per_minute: rate at which the bucket refills
+        :param max_concurrent: maximum number of calls in flight
+        :param burst: bucket capacity, defaults to max_concurrent
+        :param clock: monotonic clock in seconds
+        :param sleep: sleep function
+        """
+        self.__rate = requests_per_minute / 60.0
+        self.__capacity = burst if burst else max_concurrent
+        self.__semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.__lock = threading.Lock()
+        self.__clock = clock
+        self.__sleep = sleep
+
+        self.__tokens = float(self.__capacity)
+        self.__last_refill = clock()
+
+        self.__calls = 0
+        self.__throttled_calls = 0
+        self.__wait_time = 0.0
+        self.__max_wait_time = 0.0
+
+    def __take_token(self) -> bool:
+        """
+        Take a token from the bucket, sleeping until one is available
+        :return: True if the bucket was empty
+        """
+        throttled = False
+
+        while True:
+            with self.__lock:
+                now = self.__clock()
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last_refill) * self.__rate)
+                self.__last_refill = now
+
+                if self.__tokens >= 1:
+                    self.__tokens = self.__tokens - 1
+                    return throttled
+
+                delay = (1 - self.__tokens) / self.__rate
+
+            throttled = True
+            logger.debug('Rate limit reached, waiting %.3fs for a token.', delay)
+            self.__sleep(delay)
+
+    def acquire(self):
+        """
+        Wait for a concurrency slot and a token, must be paired with release()
+        :return: None
+        """
+        start_time = self.__clock()
+
+        throttled = not self.__semaphore.acquire(blocking=False)
+        if throttled:
+            self.__semaphore.acquire()
+
+        try:
+            throttled = self.__take_token() or throttled
+        except BaseException:
+            self.__semaphore.release()
+            raise
+
+        wait_time = self.__clock() - start_time
+
+        with self.__lock:
+            self.__calls = self.__calls + 1
+            self.__wait_time = self.__wait_time + wait_time
+            self.__max_wait_time = max(self.__max_wait_time, wait_time)
+            if throttled:
+                self.__throttled_calls = self.__throttled_calls + 1
+
+    def release(self):
+        """
+        Release the concurrency slot taken by acquire()
+        :return: None
+        """
+        self.__semaphore.release()
+
+    def call(self, function: Callable, *args, **kwargs):
+        """
+        Call a Quickbooks SDK function within the limits
+        :param function: SDK function, e.g. qbo_connection.accounts.get
+        :return: return value of the function
+        """
+        self.acquire()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.release()
+
+    def metrics(self) -> Dict:
+        """
+        Wait time metrics of the calls made through the limiter
+        :return: Dict with calls, throttled_calls, wait_time and max_wait_time (in seconds)
+        """
+        with self.__lock:
+            return {
+                'calls': self.__calls,
+                'throttled_calls': self.__throttled_calls,
+                'wait_time': self.__wait_time,
+                'max_wait_time': self.__max_wait_time
+            }
+
+
+def get_rate_limiter(realm_id: str, **kwargs) -> RateLimiter:
+    """
+    Get the rate limiter shared by all connectors of a realm in this process
+    :param realm_id: Quickbooks realm / company id
+    :param kwargs: RateLimiter arguments, only used when the limiter of the realm is created
+    :return: RateLimiter of the realm
+    """
+    with _rate_limiters_lock:
+        if realm_id not in _rate_limiters:
+            _rate_limiters[realm_id] = RateLimiter(**kwargs)
+
+        return _rate_limiters[realm_id]
@@ -0,0 +1,317 @@
+"""
+RetryPolicy() and CircuitBreaker(): Retries of transient Quickbooks failures, per realm circuit breaking
+"""
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict
+
+if TYPE_CHECKING:
+    from .rate_limiter import RateLimiter
+
+logger = logging.getLogger('QuickbooksRetry')
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+# qbosdk raises 'Error: <status code>' for the statuses it has no exception class for, e.g. 429
+_STATUS_CODE_PATTERN = re.compile(r'Error: (\d{3})')
+
+# exception classes of transient failures, matched by name so that qbosdk and requests are not imported
+_TRANSIENT_ERRORS = ('InternalServerError', 'ConnectionError', 'Timeout')
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Quickbooks while the circuit of a realm is open
+    """
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Check if a failed Quickbooks call is worth retrying: 429, 5xx, connection errors and timeouts
+    :param error: exception raised by the call
+    :return: True if transient
+    """
+    if any(error_class.__name__ in _TRANSIENT_ERRORS for error_class in type(error).__mro__):
+        return True
+
+    status_code = _STATUS_CODE_PATTERN.match(str(getattr(error, 'message', error)))
+    return bool(status_code) and (status_code.group(1) == '429' or status_code.group(1).startswith('5'))
+
+
+def retry_after(error: Exception) -> float or None:
+    """
+    Delay asked for by the Retry-After header of a failed call, when the error carries the HTTP response
+    qbosdk errors only keep the response text, so this applies to errors raised with a requests response
+    or a retry_after attribute
+    :param error: exception raised by the call
+    :return: delay in seconds or None
+    """
+    if getattr(error, 'retry_after', None) is not None:
+        return float(error.retry_after)
+
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Retry transient failures with exponential backoff and full jitter, honoring Retry-After when known
+    """
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 30.0, jitter: bool = True,
+                 retryable: Callable[[Exception], bool] = is_transient_error,
+                 sleep: Callable[[float], None] = time.sleep, rand: Callable[[], float] = random.random):
+        """
+        :param max_retries: maximum number of retries of a call
+        :param base_delay: delay before the first retry, doubled on every retry
+        :param max_delay: maximum backoff delay
+        :param jitter: wait a random delay between 0 and the backoff delay
+        :param retryable: function telling if an error is worth retrying
+        :param sleep: sleep function
+        :param rand: random number generator in [0, 1)
+        """
+        self.__max_retries = max_retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__jitter = jitter
+        self.__retryable = retryable
+        self.__sleep = sleep
+        self.__rand = rand
+        self.__lock = threading.Lock()
+
+        self.__calls = 0
+        self.__retries = 0
+        self.__retry_wait_time = 0.0
+        self.__exhausted = 0
+
+    def delay(self, retry: int, error: Exception) -> float:
+        """
+        Delay before a retry
+        :param retry: retry number, starting at 0
+        :param error: exception raised by the last attempt
+        :return: delay in seconds
+        """
+        requested_delay = retry_after(error)
+        if requested_delay is not None:
+            return requested_delay
+
+        backoff_delay = min(self.__max_delay, self.__base_delay * 2 ** retry)
+        return backoff_delay * self.__rand() if self.__jitter else backoff_delay
+
+    def call(self, function: Callable, *args, **kwargs):
+        """
+        Call a function, retrying it on transient failures
+        :param function: function, e.g. qbo_connection.purchases.post
+        :return: return value of the function
+        """
+        with self.__lock:
+            self.__calls = self.__calls + 1
+
+        retry = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if not self.__retryable(error) or isinstance(error, CircuitOpenError):
+                    raise
+
+                if retry >= self.__max_retries:
+                    with self.__lock:
+                        self.__exhausted = self.__exhausted + 1
+                    raise
+
+                delay = self.delay(retry, error)
+                logger.warning('Transient failure %r, retrying in %.3fs.', error, delay)
+
+                with self.__lock:
+                    self.__retries = self.__retries + 1
+                    self.__retry_wait_time = self.__retry_wait_time + delay
+
+                self.__sleep(delay)
+                retry = retry + 1
+
+    def metrics(self) -> Dict:
+        """
+        Retry metrics of the calls made through the policy
+        :return: Dict with calls, retries, retry_wait_time (in seconds) and exhausted (calls that ran out of retries)
+        """
+        with self.__lock:
+            return {
+                'calls': self.__calls,
+                'retries': self.__retries,
+                'retry_wait_time': self.__retry_wait_time,
+                'exhausted': self.__exhausted
+            }
+
+
+class CircuitBreaker:
+    """
+    Stop calling a realm after consecutive transient failures
+    The circuit opens after failure_threshold failures in a row and rejects calls for reset_timeout seconds,
+    then lets a single trial call through: its success closes the circuit, its failure opens it again
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 is_failure: Callable[[Exception], bool] = is_transient_error,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param failure_threshold: consecutive failures that open the circuit
+        :param reset_timeout: seconds the circuit stays open before a trial call
+        :param is_failure: function telling if an error counts as a failure of the realm
+        :param clock: monotonic clock in seconds
+        """
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__is_failure = is_failure
+        self.__clock = clock
+        self.__lock = threading.Lock()
+
+        self.__state = self.CLOSED
+        self.__failures = 0
+        self.__opened_at = None
+        self.__trial_in_progress = False
+
+        self.__opened = 0
+        self.__rejected_calls = 0
+        self.__open_time = 0.0
+
+    def __open(self, now: float):
+        self.__state = self.OPEN
+        self.__opened_at = now
+        self.__opened = self.__opened + 1
+        logger.warning('Circuit opened after %s failures.', self.__failures)
+
+    def __before_call(self) -> bool:
+        """
+        Reject the call if the circuit is open, let it through as the trial call once reset_timeout elapsed
+        :return: True for the trial call
+        """
+        with self.__lock:
+            if self.__state == self.CLOSED:
+                return False
+
+            now = self.__clock()
+            if self.__state == self.OPEN and now - self.__opened_at >= self.__reset_timeout:
+                self.__state = self.HALF_OPEN
+
+            if self.__state == self.HALF_OPEN and not self.__trial_in_progress:
+                self.__trial_in_progress = True
+                return True
+
+            self.__rejected_calls = self.__rejected_calls + 1
+            raise CircuitOpenError('circuit open, call rejected')
+
+    def __after_call(self, trial: bool, error: Exception = None):
+        """
+        Record the outcome of a call, only the trial call closes or opens again a half open circuit
+        Calls let through before the circuit opened may end while the trial is in progress
+        :param trial: the call is the trial call
+        :param error: exception raised by the call, None on success
+        :return: None
+        """
+        with self.__lock:
+            now = self.__clock()
+            if trial:
+                self.__trial_in_progress = False
+
+            if error is not None and self.__is_failure(error):
+                self.__failures = self.__failures + 1
+                if trial:
+                    self.__open_time = self.__open_time + now - self.__opened_at
+                    self.__open(now)
+                elif self.__state == self.CLOSED and self.__failures >= self.__failure_threshold:
+                    self.__open(now)
+                return
+
+            if trial:
+                self.__open_time = self.__open_time + now - self.__opened_at
+                self.__state = self.CLOSED
+                self.__opened_at = None
+                logger.info('Circuit closed.')
+            self.__failures = 0
+
+    def call(self, function: Callable, *args, **kwargs):
+        """
+        Call a function unless the circuit is open
+        :param function: function, e.g. qbo_connection.purchases.post
+        :return: return value of the function
+        """
+        trial = self.__before_call()
+
+        try:
+            response = function(*args, **kwargs)
+        except Exception as error:
+            self.__after_call(trial, error)
+            raise
+
+        self.__after_call(trial)
+        return response
+
+    def metrics(self) -> Dict:
+        """
+        Circuit metrics
+        :return: Dict with state, opened (times opened), rejected_calls and open_time (in seconds, including the
+                 current opening)
+        """
+        with self.__lock:
+            open_time = self.__open_time
+            if self.__opened_at is not None:
+                open_time = open_time + self.__clock() - self.__opened_at
+
+            return {
+                'state': self.__state,
+                'opened': self.__opened,
+                'rejected_calls': self.__rejected_calls,
+                'open_time': open_time
+            }
+
+
+def get_circuit_breaker(realm_id: str, **kwargs) -> CircuitBreaker:
+    """
+    Get the circuit breaker shared by all connectors of a realm in this process
+    :param realm_id: Quickbooks realm / company id
+    :param kwargs: CircuitBreaker arguments, only used when the circuit breaker of the realm is created
+    :return: CircuitBreaker of the realm
+    """
+    with _circuit_breakers_lock:
+        if realm_id not in _circuit_breakers:
+            _circuit_breakers[realm_id] = CircuitBreaker(**kwargs)
+
+        return _circuit_breakers[realm_id]
+
+
+def guarded(function: Callable, retry_policy: RetryPolicy = None, circuit_breaker: CircuitBreaker = None,
+            rate_limiter: 'RateLimiter' = None) -> Callable:
+    """
+    Wrap a Quickbooks SDK function in the retry policy, circuit breaker and rate limiter of a connector
+    Every attempt of the retry policy goes through the circuit breaker and takes its own rate limiter token
+    :param function: SDK function, e.g. qbo_connection.purchases.post
+    :param retry_policy: RetryPolicy, None for no retries
+    :param circuit_breaker: CircuitBreaker, None for no circuit breaking
+    :param rate_limiter: RateLimiter, None for no rate limiting
+    :return: function taking the arguments of the SDK function
+    """
+    if rate_limiter:
+        function = partial(rate_limiter.call, function)
+    if circuit_breaker:
+        function = partial(circuit_breaker.call, function)
+    if retry_policy:
+        function = partial(retry_policy.call, function)
+
+    return function
@@ -0,0 +1,202 @@
+"""
+QuickbooksSyncScheduler(): Run extract and load jobs across many Quickbooks realms
+"""
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List
+
+from .extract import QuickbooksExtractConnector
+from .load import QuickbooksLoadConnector
+from .rate_limiter import get_rate_limiter
+from .retry import RetryPolicy, get_circuit_breaker
+
+logger = logging.getLogger('QuickbooksSyncScheduler')
+
+
+def _connector_options(realm_id: str, realm_config: Dict) -> Dict:
+    """
+    Rate limiter, retry policy and circuit breaker of the connectors of a realm config
+    :param realm_id: Quickbooks realm / company id
+    :param realm_config: realm config
+    :return: Dict of connector keyword arguments
+    """
+    return {
+        'rate_limiter': get_rate_limiter(realm_id, **realm_config['rate_limit'])
+                        if 'rate_limit' in realm_config else None,
+        'retry_policy': RetryPolicy(**realm_config['retry']) if 'retry' in realm_config else None,
+        'circuit_breaker': get_circuit_breaker(realm_id, **realm_config['circuit_breaker'])
+                           if 'circuit_breaker' in realm_config else None
+    }
+
+
+def _run_extract(qbo_connection, dbconn, realm_config: Dict, result: Dict):
+    """
+    Run the extract job of a realm config
+    :param qbo_connection: QuickbooksOnlineSDK connection of the realm
+    :param dbconn: database connection of the realm
+    :param realm_config: realm config
+    :param result: realm result Dict, updated with the extracted ids
+    :return: None
+    """
+    realm_id = realm_config['realm_id']
+    extract_connector = QuickbooksExtractConnector(
+        qbo_connection=qbo_connection, dbconn=dbconn, realm_id=realm_id, **_connector_options(realm_id, realm_config)
+    )
+    extracted = extract_connector.extract_all(
+        entities=realm_config['extract'], max_workers=realm_config.get('max_concurrency', 1),
+        incremental=realm_config.get('incremental', False)
+    )
+
+    for entity, values in extracted['ids'].items():
+        result['extracted'][entity] = values
+        result['records'] = result['records'] + (len(values) if isinstance(values, list) else 1)
+
+
+def _run_load(qbo_connection, dbconn, realm_config: Dict, result: Dict):
+    """
+    Run the load job of a realm config
+    :param qbo_connection: QuickbooksOnlineSDK connection of the realm
+    :param dbconn: database connection of the realm
+    :param realm_config: realm config
+    :param result: realm result Dict, updated with the loaded objects
+    :return: None
+    """
+    realm_id = realm_config['realm_id']
+    load_connector = QuickbooksLoadConnector(
+        qbo_connection=qbo_connection, dbconn=dbconn, realm_id=realm_id, **_connector_options(realm_id, realm_config)
+    )
+    loaders = {
+        'checks': load_connector.load_check,
+        'journal_entries': load_connector.load_journal_entry
+    }
+
+    for object_type, object_ids in realm_config['load'].items():
+        loaded = result['loaded'].setdefault(object_type, {})
+        for object_id in object_ids:
+            loaded[object_id] = loaders[object_type](object_id)
+            result['records'] = result['records'] + 1
+
+
+def _run_realm_jobs(qbo_connection_factory: Callable, dbconn_factory: Callable, realm_configs: List[Dict]) -> Dict:
+    """
+    Run the extract and load jobs of a single realm, one config after the other
+    Runs inside a pool worker, so every failure is caught and reported instead of raised
+    :param qbo_connection_factory: callable returning a QuickbooksOnlineSDK connection for a realm config
+    :param dbconn_factory: callable returning a database connection for a realm config
+    :param realm_configs: configs of the realm
+    :return: realm result Dict
+    """
+    realm_id = realm_configs[0]['realm_id']
+    start_time = time.perf_counter()
+
+    result = {
+        'realm_id': realm_id,
+        'success': True,
+        'error': None,
+        'extracted': {},
+        'loaded': {},
+        'records': 0,
+        'duration': 0,
+        'refresh_token': None
+    }
+
+    try:
+        for realm_config in realm_configs:
+            qbo_connection = qbo_connection_factory(realm_config)
+            # connecting rotates the refresh token, the caller has to save the new one
+            result['refresh_token'] = qbo_connection.refresh_token
+
+            dbconn = dbconn_factory(realm_config)
+            try:
+                if realm_config.get('extract'):
+                    _run_extract(qbo_connection, dbconn, realm_config, result)
+                if realm_config.get('load'):
+                    _run_load(qbo_connection, dbconn, realm_config, result)
+            finally:
+                dbconn.close()
+
+    except Exception as error:  # pylint: disable=broad-except
+        logger.exception('Sync failed for realm %s', realm_id)
+        result['success'] = False
+        result['error'] = repr(error)
+
+    result['duration'] = time.perf_counter() - start_time
+    return result
+
+
+class QuickbooksSyncScheduler:
+    """
+    Run extract and load jobs for many Quickbooks realms on a pool of worker processes
+
+    Every realm config is a Dict with
+        realm_id: Quickbooks realm / company id
+        extract: list of QuickbooksExtractConnector.ENTITIES to extract (optional)
+        incremental: extract incrementally (optional)
+        load: Dict of 'checks' / 'journal_entries' to the list of ids to load (optional)
+        max_concurrency: maximum number of concurrent Quickbooks calls for the realm (optional, default 1)
+        rate_limit: RateLimiter arguments, shared by the connectors of the realm (optional)
+        retry: RetryPolicy arguments (optional)
+        circuit_breaker: CircuitBreaker arguments, shared by the connectors of the realm (optional)
+    plus whatever the factories need to connect to the realm.
+
+    Every realm result carries the refresh_token of the last connection made to the realm, Quickbooks rotates it
+    on connect so it has to be saved for the next run. Database connections are closed once the config ran.
+    """
+    def __init__(self, qbo_connection_factory: Callable, dbconn_factory: Callable, max_workers: int = 4,
+                 use_processes: bool = True):
+        """
+        :param qbo_connection_factory: callable returning a QuickbooksOnlineSDK connection for a realm config,
+                                       must be picklable (a module level function) when using processes
+        :param dbconn_factory: callable returning a database connection for a realm config,
+                               must be picklable (a module level function) when using processes
+        :param max_workers: number of realms synced in parallel
+        :param use_processes: use worker processes, threads otherwise
+        """
+        self.__qbo_connection_factory = qbo_connection_factory
+        self.__dbconn_factory = dbconn_factory
+        self.__max_workers = max_workers
+        self.__use_processes = use_processes
+
+    def run(self, realm_configs: List[Dict]) -> Dict:
+        """
+        Run the jobs of all realms, a failing realm does not affect the others
+        Configs of the same realm run one after the other in a single worker, so that a realm
+        never exceeds its max_concurrency
+        :param realm_configs: list of realm configs
+        :return: Dict with per realm results and aggregate throughput
+        """
+        realms = OrderedDict()
+        for realm_config in realm_configs:
+            realms.setdefault(realm_config['realm_id'], []).append(realm_config)
+
+        logger.info('Syncing %s realms.', len(realms))
+
+        executor_class = ProcessPoolExecutor if self.__use_processes else ThreadPoolExecutor
+        start_time = time.perf_counter()
+
+        results = {}
+        with executor_class(max_workers=self.__max_workers) as executor:
+            futures = [
+                executor.submit(_run_realm_jobs, self.__qbo_connection_factory, self.__dbconn_factory, configs)
+                for configs in realms.values()
+            ]
+            for future in as_completed(futures):
+                realm_result = future.result()
+                results[realm_result['realm_id']] = realm_result
+
+        duration = time.perf_counter() - start_time
+        records = sum(realm_result['records'] for realm_result in results.values())
+        failed = [realm_id for realm_id, realm_result in results.items() if not realm_result['success']]
+
+        logger.info('Synced %s realms in %.3fs, %s failed.', len(results), duration, len(failed))
+
+        return {
+            'realms': [results[realm_id] for realm_id in realms],
+            'succeeded': len(results) - len(failed),
+            'failed': failed,
+            'records': records,
+            'duration': duration,
+            'throughput': records / duration if duration else 0
+        }
@@ -0,0 +1,125 @@
+"""
+ParquetSink(): Columnar output of extracted Quickbooks data
+"""
+import logging
+import uuid
+from contextlib import contextmanager
+from datetime import date
+from os import makedirs, path, rename
+from shutil import rmtree
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger('QuickbooksParquetSink')
+
+
+class ParquetSink:
+    """
+    Write extracted entities as Parquet datasets, one per entity, hive partitioned by realm and extract date:
+        <base_path>/<entity>/realm_id=<realm_id>/extract_date=<YYYY-MM-DD>/part-<uuid>.parquet
+    Every write adds a part file, so a stream extract writes one part per page.
+    Full extracts write within replace(), which swaps in the partition once the extract is complete, so re-running
+    them on the same day does not duplicate rows. Incremental extracts append the changed records to the partition
+    and write nothing for deleted ones: readers must keep the latest LastUpdatedTime per Id and check deletions
+    against a full extract. Exchange rates are appended as well, keyed by SourceCurrencyCode and AsOfDate.
+    Files are not part of the database transaction, parts written within a rolled back transaction() stay on disk.
+    Needs pyarrow, installed with pip install qbo-db-connector[parquet]
+    """
+    # arrow types of the extract DDL column types
+    ARROW_TYPES = {
+        'TEXT': 'string',
+        'REAL': 'float64',
+        'INTEGER': 'int64',
+        'BOOLEAN': 'bool_',
+        'DATE': 'date32'
+    }
+
+    def __init__(self, base_path: str, extract_date: str = None, compression: str = 'snappy'):
+        """
+        :param base_path: directory of the datasets
+        :param extract_date: extract_date partition (YYYY-MM-DD), defaults to the day of each write
+        :param compression: Parquet compression codec
+        """
+        self.base_path = base_path
+        self.__extract_date = extract_date
+        self.__compression = compression
+        self.__staging_paths = {}
+
+    def partition_path(self, realm_id: str, entity: str, extract_date: str = None) -> str:
+        """
+        Directory of a partition of an entity dataset
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name
+        :param extract_date: extract date (YYYY-MM-DD), defaults to the extract date of the sink
+        :return: partition directory
+        """
+        extract_date = extract_date if extract_date else (self.__extract_date or date.today().isoformat())
+        return path.join(
+            self.base_path, entity, 'realm_id={0}'.format(realm_id), 'extract_date={0}'.format(extract_date)
+        )
+
+    @contextmanager
+    def replace(self, realm_id: str, entity: str) -> Iterator[None]:
+        """
+        Replace the partition of an entity with the writes made within the block
+        Writes go to a staging directory, ignored by pyarrow datasets as its name starts with _, which is renamed
+        to the partition when the block exits. The partition is left as it was if the block raises
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name
+        :return: None
+        """
+        assert (realm_id, entity) not in self.__staging_paths, '{0} partition already being replaced'.format(entity)
+
+        partition_path = self.partition_path(realm_id, entity)
+        partition_parent, partition_name = path.split(partition_path)
+        staging_path = path.join(partition_parent, '_{0}.{1}'.format(partition_name, uuid.uuid4().hex))
+        makedirs(staging_path)
+
+        self.__staging_paths[(realm_id, entity)] = staging_path
+        try:
+            yield
+        except BaseException:
+            rmtree(staging_path, ignore_errors=True)
+            raise
+        finally:
+            del self.__staging_paths[(realm_id, entity)]
+
+        replaced_path = '{0}.replaced'.format(staging_path)
+        if path.exists(partition_path):
+            rename(partition_path, replaced_path)
+        rename(staging_path, partition_path)
+        rmtree(replaced_path, ignore_errors=True)
+
+        logger.info('%s partition %s replaced.', entity, partition_path)
+
+    def write(self, realm_id: str, entity: str, column_types: Dict[str, str], rows: List[tuple]) -> str or None:
+        """
+        Write rows of an entity to a new part file of its partition, or of its staging directory within replace()
+        :param realm_id: Quickbooks realm / company id
+        :param entity: entity name
+        :param column_types: column names to their extract DDL type, in row order
+        :param rows: rows to write
+        :return: path of the part file, None if there are no rows
+        """
+        import pyarrow as pa  # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+        if not rows:
+            return None
+
+        columns = list(column_types)
+        arrays = [
+            pa.array([row[index] for row in rows]).cast(
+                getattr(pa, self.ARROW_TYPES.get(column_types[column].upper(), 'string'))()
+            )
+            for index, column in enumerate(columns)
+        ]
+        table = pa.Table.from_arrays(arrays, names=columns)
+
+        partition_path = self.__staging_paths.get((realm_id, entity)) or self.partition_path(realm_id, entity)
+        makedirs(partition_path, exist_ok=True)
+        file_path = path.join(partition_path, 'part-{0}.parquet'.format(uuid.uuid4().hex))
+
+        pq.write_table(table, file_path, compression=self.__compression)
+
+        logger.info('%s %s rows written to %s.', len(rows), entity, file_path)
+        return file_path
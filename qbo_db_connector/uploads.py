@@ -0,0 +1,173 @@
+"""
+MultipartUpload(): Streamed multipart bodies of Quickbooks attachment uploads
+"""
+import base64
+import hashlib
+import json
+from typing import Callable, Dict, Iterable, Iterator
+
+# boundary of the multipart body, must match the Content-Type header sent by qbosdk ApiBase._post_file
+BOUNDARY = 'YOjcLaTlykb6OxfYJx4O07j1MweeMFem'
+
+# raw bytes encoded at a time, a multiple of 3 so that the base64 chunks concatenate without padding
+CHUNK_SIZE = 3 * 16 * 1024
+
+# content types Quickbooks accepts for attachments, as listed by qbosdk
+CONTENT_TYPES = {
+    'ai': 'application/postscript',
+    'csv': 'text/csv',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'eps': 'application/postscript',
+    'gif': 'image/gif',
+    'jpeg': 'image/jpeg',
+    'jpg': 'image/jpg',
+    'png': 'image/png',
+    'ods': 'application/vnd.oasis.opendocument.spreadsheet',
+    'pdf': 'application/pdf',
+    'rtf': 'text/rtf',
+    'tif': 'image/tiff',
+    'txt': 'text/plain',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'xml': 'text/xml'
+}
+
+
+def content_type(file_name: str) -> str or None:
+    """
+    Content type of a file Quickbooks accepts as attachment
+    :param file_name: name of the file
+    :return: content type or None if not supported
+    """
+    return CONTENT_TYPES.get(file_name.split('.')[-1].lower())
+
+
+def base64_length(size: int) -> int:
+    """
+    Length of the base64 encoding of some bytes
+    :param size: number of bytes
+    :return: number of base64 characters
+    """
+    return 4 * ((size + 2) // 3)
+
+
+def encoded_bytes(content: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Base64 encode bytes a chunk at a time
+    :param content: raw bytes, e.g. a BLOB
+    :param chunk_size: raw bytes per chunk, a multiple of 3
+    :return: Iterator of base64 chunks
+    """
+    for start in range(0, len(content), chunk_size):
+        yield base64.b64encode(content[start:start + chunk_size])
+
+
+def file_chunks(file_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a file a chunk at a time, without reading it whole
+    :param file_path: path of the file
+    :param chunk_size: bytes per chunk
+    :return: Iterator of raw chunks
+    """
+    with open(file_path, 'rb') as file:
+        chunk = file.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = file.read(chunk_size)
+
+
+def encoded_file(file_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Base64 encode a file a chunk at a time, without reading it whole
+    :param file_path: path of the file
+    :param chunk_size: raw bytes per chunk, a multiple of 3
+    :return: Iterator of base64 chunks
+    """
+    for chunk in file_chunks(file_path, chunk_size):
+        yield base64.b64encode(chunk)
+
+
+def encoded_text(content: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Chunks of content already stored in base64
+    :param content: base64 text
+    :param chunk_size: characters per chunk
+    :return: Iterator of base64 chunks
+    """
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size].encode('ascii')
+
+
+def content_hash(chunks: Iterable[bytes]) -> str:
+    """
+    Hash of the raw content of an attachment, whatever the column it is stored in
+    :param chunks: raw content chunks
+    :return: sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class MultipartUpload:
+    """
+    File like multipart body of an attachment upload, producing the base64 content as it is read
+    The body is the one qbosdk Attachments.post builds in memory. Its length is known upfront, so that requests
+    sends it with a Content-Length and reads it in blocks
+    """
+    def __init__(self, file_name: str, file_content_type: str, encoded_chunks: Callable[[], Iterator[bytes]],
+                 encoded_length: int):
+        """
+        :param file_name: name of the file
+        :param file_content_type: content type of the file
+        :param encoded_chunks: function returning an Iterator of the base64 chunks of the content
+        :param encoded_length: length of the base64 content
+        """
+        metadata: Dict = {'Content-Type': file_content_type}
+        head = (
+            '\n--{0}\n'
+            'Content-Disposition: form-data; name="file_metadata_01";\n'
+            'Content-Type: application/json\n'
+            '{1}\n'
+            '--{0}\n'
+            'Content-Disposition: form-data; name="file_content_01"; filename="{2}"\n'
+            'Content-Type: {3}\n'
+            'Content-Transfer-Encoding: base64\n'
+            '\n'
+        ).format(BOUNDARY, json.dumps(metadata), file_name, file_content_type).encode('utf-8')
+        tail = '\n\n--{0}--\n'.format(BOUNDARY).encode('utf-8')
+
+        self.__length = len(head) + encoded_length + len(tail)
+        self.__parts = self.__body(head, encoded_chunks, tail)
+        self.__buffer = b''
+
+    @staticmethod
+    def __body(head: bytes, encoded_chunks: Callable[[], Iterator[bytes]], tail: bytes) -> Iterator[bytes]:
+        yield head
+        yield from encoded_chunks()
+        yield tail
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Read the next bytes of the body
+        :param size: maximum number of bytes, -1 for the rest of the body
+        :return: bytes, empty once the body is read
+        """
+        while size < 0 or len(self.__buffer) < size:
+            part = next(self.__parts, None)
+            if part is None:
+                break
+            self.__buffer = self.__buffer + part
+
+        if size < 0:
+            data, self.__buffer = self.__buffer, b''
+        else:
+            data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+
+        return data
@@ -22,10 +22,12 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     install_requires=[
         'typing==3.7.4.1',
-        'pandas==0.25.2',
         'logger==1.4',
         'requests'
     ],
+    extras_require={
+        'parquet': ['pyarrow']
+    },
     classifiers=[
         'Topic :: Internet :: WWW/HTTP',
         'Intended Audience :: Developers',
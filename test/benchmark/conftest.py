@@ -0,0 +1,149 @@
+"""
+Benchmark Configuration
+
+QBO_BENCHMARK_SCALE sets the size of the synthetic data as a fraction of test.common.synthetic.FULL_SCALE
+(default 0.01). QBO_BENCHMARK_OUTPUT is the path of a JSON report of all timings, to compare releases.
+"""
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import time
+import tracemalloc
+
+from test.common.synthetic import get_synthetic_qbo, insert_synthetic_load_rows, scaled_counts
+from test.common.utilities import get_mock_qbo
+
+import pytest
+from qbo_db_connector import QuickbooksExtractConnector, QuickbooksLoadConnector
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def qbo():
+    """
+    Quickbooks Online SDK Mock Object
+    """
+    return get_mock_qbo()
+
+
+@pytest.fixture
+def dbconn():
+    """
+    Make DB Connection
+    :return: DB Connection
+    """
+    sqlite_db_file = '/tmp/test_qbo_benchmark.db'
+    if os.path.exists(sqlite_db_file):
+        os.remove(sqlite_db_file)
+    conn = sqlite3.connect(sqlite_db_file, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    return conn
+
+
+@pytest.fixture
+def qec(qbo, dbconn):
+    """
+    Quickbooks Extract instance with mock connection
+    """
+    res = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn)
+    res.create_tables()
+    return res
+
+
+@pytest.fixture(scope='session')
+def counts():
+    """
+    Synthetic record counts at QBO_BENCHMARK_SCALE
+    """
+    scale = float(os.environ.get('QBO_BENCHMARK_SCALE', '0.01'))
+    logger.info('Benchmark scale %s: %s', scale, scaled_counts(scale))
+    return scaled_counts(scale)
+
+
+@pytest.fixture
+def synthetic_qbo(counts):
+    """
+    Quickbooks Online SDK Mock Object serving synthetic data
+    """
+    return get_synthetic_qbo(counts)
+
+
+@pytest.fixture
+def synthetic_qec(synthetic_qbo, dbconn):
+    """
+    Quickbooks Extract instance serving synthetic data
+    """
+    res = QuickbooksExtractConnector(qbo_connection=synthetic_qbo, dbconn=dbconn)
+    res.create_tables()
+    return res
+
+
+@pytest.fixture
+def synthetic_qlc(synthetic_qbo, dbconn, counts):
+    """
+    Quickbooks Load instance with synthetic qbo_load_* rows
+    """
+    res = QuickbooksLoadConnector(qbo_connection=synthetic_qbo, dbconn=dbconn)
+    res.create_tables()
+    insert_synthetic_load_rows(dbconn, counts)
+    return res
+
+
+@pytest.fixture(scope='session')
+def benchmark_results():
+    """
+    Timings of all benchmarks of the session, written to QBO_BENCHMARK_OUTPUT if set
+    """
+    results = []
+    yield results
+
+    output_path = os.environ.get('QBO_BENCHMARK_OUTPUT')
+    if output_path:
+        with open(output_path, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+@pytest.fixture
+def benchmark(request, benchmark_results):
+    """
+    Time a function over a number of rounds and measure its peak memory in one extra traced round
+    With rounds=0 the function runs only once, traced, for functions that cannot be repeated
+    Usage: benchmark(function, *args, rounds=3, label=None, **kwargs), returns the return value of the function.
+    label tells apart the functions compared by a test, benchmark.stats holds the timings of the last run
+    """
+    def run(function, *args, rounds=3, label=None, **kwargs):
+        timings = []
+        for _ in range(rounds):
+            start_time = time.perf_counter()
+            function(*args, **kwargs)
+            timings.append(time.perf_counter() - start_time)
+
+        tracemalloc.start()
+        try:
+            start_time = time.perf_counter()
+            result = function(*args, **kwargs)
+            traced_time = time.perf_counter() - start_time
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings = timings if timings else [traced_time]
+
+        stats = {
+            'name': '{0}[{1}]'.format(request.node.name, label) if label else request.node.name,
+            'rounds': rounds,
+            'min': min(timings),
+            'mean': statistics.mean(timings),
+            'max': max(timings),
+            'peak_memory': peak_memory
+        }
+        benchmark_results.append(stats)
+        run.stats = stats
+        logger.info('%s: min %.4fs, mean %.4fs, max %.4fs, peak memory %.1f KiB', stats['name'], stats['min'],
+                    stats['mean'], stats['max'], peak_memory / 1024)
+
+        return result
+
+    return run
@@ -0,0 +1,88 @@
+"""
+Extract Benchmarks on synthetic data
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def test_extract_accounts(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_accounts
+    """
+    assert len(benchmark(synthetic_qec.extract_accounts)) == counts['accounts']
+
+
+def test_extract_classes(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_classes
+    """
+    assert len(benchmark(synthetic_qec.extract_classes)) == counts['classes']
+
+
+def test_extract_departments(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_departments
+    """
+    assert len(benchmark(synthetic_qec.extract_departments)) == counts['departments']
+
+
+def test_extract_employees(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_employees
+    """
+    assert len(benchmark(synthetic_qec.extract_employees)) == counts['employees']
+
+
+def test_extract_exchange_rates(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_exchange_rates
+    """
+    assert len(benchmark(synthetic_qec.extract_exchange_rates)) == counts['exchange_rates']
+
+
+def test_extract_exchange_rates_range(benchmark, synthetic_qec, dbconn, counts):
+    """
+    Benchmark extract_exchange_rates_range, one round as backfilled days are skipped afterwards
+    """
+    exchange_rates = benchmark(synthetic_qec.extract_exchange_rates_range, '2019-12-16', '2019-12-16', rounds=0)
+    assert len(exchange_rates) == counts['exchange_rates']
+
+
+def test_extract_home_currency(benchmark, synthetic_qec):
+    """
+    Benchmark extract_home_currency
+    """
+    assert benchmark(synthetic_qec.extract_home_currency) == 'USD'
+
+
+def test_extract_all(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_all
+    """
+    assert len(benchmark(synthetic_qec.extract_all)['ids']['accounts']) == counts['accounts']
+
+
+def test_extract_accounts_incremental(benchmark, synthetic_qec, counts):
+    """
+    Benchmark incremental extract_accounts
+    """
+    assert len(benchmark(synthetic_qec.extract_accounts, incremental=True)) == counts['accounts']
+
+
+def test_stream_extract_accounts(benchmark, synthetic_qec, counts):
+    """
+    Benchmark stream_extract of accounts
+    """
+    assert benchmark(lambda: sum(1 for _ in synthetic_qec.stream_extract('accounts'))) == counts['accounts']
+
+
+def test_extract_changes_accounts(benchmark, synthetic_qec, counts):
+    """
+    Benchmark extract_changes of accounts, once on an empty table and then on unchanged accounts
+    """
+    changes = benchmark(synthetic_qec.extract_changes, 'accounts', rounds=0, label='first')
+    assert len(changes['inserted']) == counts['accounts']
+
+    changes = benchmark(synthetic_qec.extract_changes, 'accounts', label='unchanged')
+    assert changes == {'inserted': [], 'updated': [], 'deleted': []}
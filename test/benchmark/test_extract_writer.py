@@ -0,0 +1,44 @@
+"""
+Benchmark of the extract table writer against the pandas DataFrame.to_sql path
+"""
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ROUNDS = 50
+
+
+def to_sql_extract_accounts(qbo, dbconn):
+    """
+    Accounts extract as implemented with pandas before the executemany writer
+    Writes to a separate, unkeyed table so that repeated rounds append like the original path did
+    """
+    df = pd.DataFrame(qbo.accounts.get())
+    df = df[['Id', 'Name']]
+    df.to_sql('qbo_extract_accounts_to_sql', dbconn, if_exists='append', index=False)
+    return df['Id'].to_list()
+
+
+def test_extract_accounts_writer(qbo, qec, dbconn, benchmark):
+    """
+    Compare the executemany writer with DataFrame.to_sql for a small reference table, the timings of both are
+    reported through the benchmark fixture rather than asserted on, as wall clock comparisons are noisy
+    """
+    to_sql_ids = to_sql_extract_accounts(qbo, dbconn)
+    to_sql_rows = dbconn.execute('select * from qbo_extract_accounts_to_sql').fetchall()
+
+    writer_ids = qec.extract_accounts()
+    writer_rows = dbconn.execute('select * from qbo_extract_accounts order by rowid').fetchall()
+
+    assert writer_ids == to_sql_ids, 'writer return value differs from to_sql path'
+    assert writer_rows == to_sql_rows, 'writer rows differ from to_sql path'
+
+    benchmark(to_sql_extract_accounts, qbo, dbconn, rounds=ROUNDS, label='to_sql')
+    to_sql_time = benchmark.stats['min']
+    benchmark(qec.extract_accounts, rounds=ROUNDS, label='executemany')
+    writer_time = benchmark.stats['min']
+
+    logger.info('accounts to_sql: %.3fms, executemany: %.3fms (%.1fx)',
+                to_sql_time * 1000, writer_time * 1000, to_sql_time / writer_time)
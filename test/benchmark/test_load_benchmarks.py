@@ -0,0 +1,79 @@
+"""
+Load Benchmarks on synthetic data
+"""
+import logging
+
+from test.common.synthetic import CHECK_LINES, JOURNAL_ENTRY_LINES
+from test.common.utilities import mock_batch_post
+
+logger = logging.getLogger(__name__)
+
+
+def test_load_check(benchmark, synthetic_qlc, synthetic_qbo, counts):
+    """
+    Benchmark load_check on the last check
+    """
+    benchmark(synthetic_qlc.load_check, check_id='C{0}'.format(counts['checks']))
+    assert len(synthetic_qbo.purchases._post_request.call_args[0][0]['Line']) == CHECK_LINES
+
+
+def test_load_journal_entry(benchmark, synthetic_qlc, synthetic_qbo, counts):
+    """
+    Benchmark load_journal_entry on the last journal entry
+    """
+    benchmark(synthetic_qlc.load_journal_entry, journal_entry_id='J{0}'.format(counts['journal_entries']))
+    assert len(synthetic_qbo.journal_entries._post_request.call_args[0][0]['Line']) == JOURNAL_ENTRY_LINES
+
+
+def test_load_attachments(benchmark, synthetic_qlc, counts):
+    """
+    Benchmark load_attachments
+    """
+    responses = benchmark(synthetic_qlc.load_attachments, ref_id='1453', ref_type='Purchase', prep_id='P1')
+    assert len(responses) == counts['attachments']
+
+
+def reloaded(dbconn, function, *args, **kwargs):
+    """
+    Run a bulk load from scratch, forgetting the load state of the previous round that would skip every object
+    Bulk loads post every synthetic object, so their benchmarks run a single timed round
+    """
+    dbconn.execute('delete from qbo_load_state')
+    dbconn.commit()
+    return function(*args, **kwargs)
+
+
+def test_load_checks(benchmark, synthetic_qlc, synthetic_qbo, dbconn, counts):
+    """
+    Benchmark load_checks, posting batch requests
+    """
+    synthetic_qbo.purchases._post_request.side_effect = mock_batch_post(
+        'Purchase', {'Purchase': {'Id': '1453', 'TotalAmt': 698.98}}
+    )
+    check_ids = ['C{0}'.format(index) for index in range(1, counts['checks'] + 1)]
+
+    results = benchmark(reloaded, dbconn, synthetic_qlc.load_checks, check_ids, rounds=1)
+    assert all(result['success'] for result in results.values()) and len(results) == counts['checks']
+
+
+def test_load_journal_entries(benchmark, synthetic_qlc, synthetic_qbo, dbconn, counts):
+    """
+    Benchmark load_journal_entries, posting batch requests
+    """
+    synthetic_qbo.journal_entries._post_request.side_effect = mock_batch_post(
+        'JournalEntry', {'JournalEntry': {'Id': '1467', 'TotalAmt': 23.98}}
+    )
+    journal_entry_ids = ['J{0}'.format(index) for index in range(1, counts['journal_entries'] + 1)]
+
+    results = benchmark(reloaded, dbconn, synthetic_qlc.load_journal_entries, journal_entry_ids, rounds=1)
+    assert all(result['success'] for result in results.values()) and len(results) == counts['journal_entries']
+
+
+def test_load_concurrently(benchmark, synthetic_qlc, dbconn, counts):
+    """
+    Benchmark load_concurrently of checks, posting them one by one on the pool
+    """
+    check_ids = ['C{0}'.format(index) for index in range(1, counts['checks'] + 1)]
+
+    results = benchmark(reloaded, dbconn, lambda: dict(synthetic_qlc.load_concurrently('checks', check_ids)), rounds=1)
+    assert all(result['success'] for result in results.values()) and len(results) == counts['checks']
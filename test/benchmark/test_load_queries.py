@@ -0,0 +1,51 @@
+"""
+Benchmark of the load connector reads against the str.format + pandas read_sql_query path
+"""
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ROUNDS = 20
+
+
+def read_sql_query_check(dbconn, check_id):
+    """
+    Check reads as implemented with str.format SQL and pandas before the parameterized query layer
+    """
+    check = pd.read_sql_query(
+        sql="SELECT * FROM qbo_load_checks where id = '{0}'".format(check_id),
+        con=dbconn
+    ).to_dict(orient='records')[0]
+
+    check_line_items = pd.read_sql_query(
+        sql="SELECT * FROM qbo_load_check_lineitems where check_id = '{0}'".format(check_id),
+        con=dbconn).to_dict(orient='records')
+
+    return check, check_line_items
+
+
+def test_load_check_reads(synthetic_qlc, synthetic_qbo, dbconn, counts, benchmark):
+    """
+    Compare the check reads of the load connector with the reads of the previous path, both are reported
+    through the benchmark fixture rather than asserted on, as wall clock comparisons are noisy
+    """
+    check_id = 'C{0}'.format(counts['checks'])
+    # the reads load_check makes before building the payload
+    read_rows = getattr(synthetic_qlc, '_QuickbooksLoadConnector__read_rows')
+
+    _, check_line_items = read_sql_query_check(dbconn, check_id)
+    synthetic_qlc.load_check(check_id=check_id)
+    lines = synthetic_qbo.purchases._post_request.call_args[0][0]['Line']
+    assert [line['Amount'] for line in lines] == [line['amount'] for line in check_line_items], \
+        'line items differ from the read_sql_query path'
+
+    benchmark(read_sql_query_check, dbconn, check_id, rounds=ROUNDS, label='read_sql_query')
+    read_sql_query_time = benchmark.stats['min']
+    rows = benchmark(read_rows, 'checks', [check_id], rounds=ROUNDS, label='parameterized')
+    parameterized_time = benchmark.stats['min']
+
+    assert len(rows[check_id][1]) == len(check_line_items), 'line items differ from the read_sql_query path'
+    logger.info('check reads read_sql_query: %.3fms, parameterized: %.3fms (%.1fx)',
+                read_sql_query_time * 1000, parameterized_time * 1000, read_sql_query_time / parameterized_time)
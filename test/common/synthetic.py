@@ -0,0 +1,160 @@
+"""
+Synthetic Quickbooks data at configurable scale for benchmarks
+"""
+import logging
+import random
+
+from test.common.utilities import get_mock_qbo_from_dict
+
+logger = logging.getLogger(__name__)
+
+# record counts at scale 1.0
+FULL_SCALE = {
+    'accounts': 100000,
+    'classes': 5000,
+    'departments': 5000,
+    'employees': 20000,
+    'exchange_rates': 1000,
+    'checks': 10000,
+    'journal_entries': 10000,
+    'attachments': 1000
+}
+
+CHECK_LINES = 500
+JOURNAL_ENTRY_LINES = 500
+
+
+def scaled_counts(scale):
+    """
+    Record counts of every entity at a scale
+    :param scale: fraction of FULL_SCALE
+    :return: Dict of entity to count, at least 1
+    """
+    return {entity: max(1, int(count * scale)) for entity, count in FULL_SCALE.items()}
+
+
+def last_updated_time(index):
+    """
+    Deterministic MetaData for the n-th record
+    """
+    return {'LastUpdatedTime': '2019-{0:02d}-{1:02d}T10:00:00-07:00'.format(index % 12 + 1, index % 28 + 1)}
+
+
+def synthetic_qbo_dict(counts):
+    """
+    Mock qbo dictionary, in the format of mock_qbo.json, with full Quickbooks style payloads
+    :param counts: Dict of entity to record count
+    :return: mock qbo dictionary
+    """
+    accounts = [
+        {
+            'Id': str(index), 'Name': 'Account {0}'.format(index), 'Active': True,
+            'AccountType': 'Expense', 'CurrentBalance': 0, 'MetaData': last_updated_time(index)
+        }
+        for index in range(1, counts['accounts'] + 1)
+    ]
+    employees = [
+        {
+            'Id': str(index), 'GivenName': 'Given {0}'.format(index), 'FamilyName': 'Family {0}'.format(index),
+            'DisplayName': 'Employee {0}'.format(index), 'Active': True,
+            'PrimaryAddr': {'Line1': '{0} Main Street'.format(index), 'City': 'Bengaluru'},
+            'MetaData': last_updated_time(index)
+        }
+        for index in range(1, counts['employees'] + 1)
+    ]
+    currencies = ['CUR{0}'.format(index) for index in range(counts['exchange_rates'])]
+
+    return {
+        'accounts': accounts,
+        'classes': [
+            {'Id': str(index), 'Name': 'Class {0}'.format(index), 'Active': True, 'MetaData': last_updated_time(index)}
+            for index in range(1, counts['classes'] + 1)
+        ],
+        'departments': [
+            {'Id': str(index), 'Name': 'Dept {0}'.format(index), 'Active': True, 'MetaData': last_updated_time(index)}
+            for index in range(1, counts['departments'] + 1)
+        ],
+        'employees': employees,
+        'home_currency': [{'home_currency': 'USD'}],
+        'exchange_rates': [
+            {'SourceCurrencyCode': currency, 'TargetCurrencyCode': 'USD', 'Rate': 1.5, 'AsOfDate': '2019-12-16'}
+            for currency in currencies
+        ],
+        'check_response': {'Purchase': {'Id': '1453', 'TotalAmt': 698.98}},
+        'journal_entry_response': {'JournalEntry': {'Id': '1467', 'TotalAmt': 23.98}},
+        'check_sdk_response': {'Purchase': {'Id': '1453', 'TotalAmt': 698.98}},
+        'journal_entry_sdk_response': {'JournalEntry': {'Id': '1467', 'TotalAmt': 23.98}}
+    }
+
+
+def get_synthetic_qbo(counts):
+    """
+    Mock qbo sdk object serving synthetic data, for SDK gets as well as paged queries
+    :param counts: Dict of entity to record count
+    :return: mock qbo sdk object
+    """
+    mock_qbo_dict = synthetic_qbo_dict(counts)
+    mock_qbo = get_mock_qbo_from_dict(mock_qbo_dict)
+
+    mock_qbo.exchange_rates._query_get_all.return_value = mock_qbo_dict['exchange_rates']
+    mock_qbo.attachments._post_file.side_effect = lambda data, api_url: {'Id': '5000', 'Size': len(data.read())}
+    mock_qbo.attachments._post_request.return_value = {'Attachable': {'Id': '5000', 'FileName': 'receipt.png'}}
+    mock_qbo.attachments._get_request.return_value = {'Id': '5000', 'SyncToken': '0', 'AttachableRef': []}
+
+    return mock_qbo
+
+
+def insert_synthetic_load_rows(dbconn, counts, check_lines=CHECK_LINES, journal_entry_lines=JOURNAL_ENTRY_LINES):
+    """
+    Insert synthetic rows in the qbo_load_* tables
+    :param dbconn: db connection with the load tables
+    :param counts: Dict of entity to record count
+    :param check_lines: line items per check
+    :param journal_entry_lines: line items per journal entry
+    :return: None
+    """
+    rand = random.Random(42)
+
+    dbconn.executemany(
+        'insert into qbo_load_checks (bank_account, entity, employee_email, department, record_date, id, currency, '
+        'private_note) values (?, ?, ?, ?, ?, ?, ?, ?)',
+        (
+            ('142', '67', 'user{0}@fyle.in'.format(index), '7', '2019-09-25', 'C{0}'.format(index), 'USD',
+             'Check {0}'.format(index))
+            for index in range(1, counts['checks'] + 1)
+        )
+    )
+    dbconn.executemany(
+        'insert into qbo_load_check_lineitems (account, class, amount, description, check_id, expense_id) '
+        'values (?, ?, ?, ?, ?, ?)',
+        (
+            ('146', None, round(rand.uniform(1, 1000), 2), 'Expense {0}'.format(line),
+             'C{0}'.format(index), 'tx{0}_{1}'.format(index, line))
+            for index in range(1, counts['checks'] + 1) for line in range(check_lines)
+        )
+    )
+    dbconn.executemany(
+        'insert into qbo_load_journal_entries (employee_email, record_date, id, currency, private_note) '
+        'values (?, ?, ?, ?, ?)',
+        (
+            ('user{0}@fyle.in'.format(index), '2019-09-25', 'J{0}'.format(index), 'USD', 'Journal {0}'.format(index))
+            for index in range(1, counts['journal_entries'] + 1)
+        )
+    )
+    dbconn.executemany(
+        'insert into qbo_load_journal_entry_lineitems (posting_type, entity, account, department, class, amount, '
+        'description, journal_entry_id, expense_id) values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (
+            ('Debit' if line % 2 else 'Credit', '67', '146', '7', None, round(rand.uniform(1, 1000), 2),
+             'Expense {0}'.format(line), 'J{0}'.format(index), 'tx{0}_{1}'.format(index, line))
+            for index in range(1, counts['journal_entries'] + 1) for line in range(journal_entry_lines)
+        )
+    )
+    dbconn.executemany(
+        'insert into qbo_load_attachments (ref_id, prep_id, ref_type, content, filename) values (?, ?, ?, ?, ?)',
+        (
+            ('C1', 'P1', 'Purchase', 'aGVsbG8gd29ybGQ=' * 64, 'receipt{0}.png'.format(index))
+            for index in range(counts['attachments'])
+        )
+    )
+    dbconn.commit()
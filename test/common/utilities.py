@@ -4,8 +4,10 @@ Common utility for QBO connector tests
 import copy
 import json
 import logging
+import re
 
 from os import path
+from urllib.parse import unquote
 from unittest.mock import Mock
 
 from qbosdk import QuickbooksOnlineSDK
@@ -14,6 +16,30 @@ from qbo_db_connector import QuickbooksExtractConnector, QuickbooksLoadConnector
 logger = logging.getLogger(__name__)
 
 
+class FakeClock:
+    """
+    Clock that only moves forward when slept on or set, for the clock and sleep of the rate limiter, retries and cache
+    """
+    def __init__(self, now: float = 0.0):
+        """
+        :param now: start time in seconds
+        """
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Move the clock forward
+        :param seconds: seconds to sleep
+        :return: None
+        """
+        self.sleeps.append(seconds)
+        self.now = self.now + seconds
+
+
 def dict_factory(cursor, row):
     """
     Sqlite dictionary row factory
@@ -42,7 +68,14 @@ def get_mock_qbo_from_file(filename):
     Returns mock objects for QBO Extract Connectors
     :param: JSON file name
     """
-    mock_qbo_dict = get_mock_qbo_dict(filename)
+    return get_mock_qbo_from_dict(get_mock_qbo_dict(filename))
+
+
+def get_mock_qbo_from_dict(mock_qbo_dict):
+    """
+    Returns mock objects for QBO Extract Connectors
+    :param: mock qbo dictionary, in the format of mock_qbo.json
+    """
     mock_qbo = Mock()
     mock_qbo.accounts.get.return_value = mock_qbo_dict['accounts']
     mock_qbo.classes.get.return_value = mock_qbo_dict['classes']
@@ -50,13 +83,94 @@ def get_mock_qbo_from_file(filename):
     mock_qbo.employees.get.return_value = mock_qbo_dict['employees']
     mock_qbo.home_currency.get.return_value = mock_qbo_dict['home_currency']
     mock_qbo.exchange_rates.get.return_value = mock_qbo_dict['exchange_rates']
+    mock_qbo.preferences.get.return_value = {
+        'CurrencyPrefs': {
+            'HomeCurrency': {
+                'value': mock_qbo_dict['home_currency'][0]['home_currency'] if mock_qbo_dict['home_currency'] else None
+            }
+        }
+    }
     mock_qbo.purchases.save.return_value = copy.deepcopy(mock_qbo_dict['check_response'])
     mock_qbo.journal_entries.save.return_value = copy.deepcopy(mock_qbo_dict['journal_entry_response'])
     mock_qbo.purchases.post.return_value = copy.deepcopy(mock_qbo_dict['check_sdk_response'])
     mock_qbo.journal_entries.post.return_value = copy.deepcopy(mock_qbo_dict['journal_entry_sdk_response'])
+    mock_qbo.purchases._post_request.return_value = copy.deepcopy(mock_qbo_dict['check_sdk_response'])
+    mock_qbo.journal_entries._post_request.return_value = copy.deepcopy(mock_qbo_dict['journal_entry_sdk_response'])
+
+    # list entities are queried page by page, serve the records of their get()
+    for entity, object_type in QuickbooksExtractConnector.QUERY_OBJECT_TYPES.items():
+        sdk_api = getattr(mock_qbo, entity)
+        sdk_api._get_request.side_effect = mock_query_pages(object_type, sdk_api.get)
     return mock_qbo
 
 
+def mock_query_pages(object_type, records):
+    """
+    Side effect for mocked ApiBase._get_request that serves paged Quickbooks query responses
+    :param object_type: Quickbooks object type, e.g. Account
+    :param records: all records of the object type, or a mocked get() whose return value they are
+    :return: function returning the QueryResponse for the STARTPOSITION / MAXRESULTS of the query
+    """
+    def get_request(response_type, api_url):
+        assert response_type == 'QueryResponse', 'only query responses are mocked'
+        start_position = int(re.search(r'STARTPOSITION (\d+)', api_url).group(1))
+        # Quickbooks caps pages at 1000 records
+        max_results = min(int(re.search(r'MAXRESULTS (\d+)', api_url).group(1)), 1000)
+
+        all_records = records.return_value if isinstance(records, Mock) else records
+        page = all_records[start_position - 1:start_position - 1 + max_results]
+        if not page:
+            return {}
+
+        return {
+            object_type: copy.deepcopy(page),
+            'startPosition': start_position,
+            'maxResults': len(page)
+        }
+
+    return get_request
+
+
+def get_request_calls(sdk_api, url_part: str = 'STARTPOSITION') -> int:
+    """
+    Number of calls of a mocked ApiBase._get_request whose url contains a part, query pages by default
+    :param sdk_api: mocked SDK api, e.g. qbo.accounts
+    :param url_part: part of the decoded url
+    :return: number of calls
+    """
+    return sum(1 for call in sdk_api._get_request.call_args_list if url_part in unquote(call[0][1]))
+
+
+def mock_batch_post(qbo_object_type, sdk_response, fault_ids=()):
+    """
+    Side effect for mocked ApiBase._post_request that serves Quickbooks batch responses
+    :param qbo_object_type: Quickbooks object type, e.g. Purchase
+    :param sdk_response: response of a single post of the object type
+    :param fault_ids: bIds answered with a Fault
+    :return: function returning the BatchItemResponse of a BatchItemRequest
+    """
+    def post_request(data, api_url):
+        assert api_url.startswith('/batch'), 'only batch requests are mocked'
+        batch_item_responses = []
+
+        for index, batch_item in enumerate(data['BatchItemRequest']):
+            if batch_item['bId'] in fault_ids:
+                batch_item_responses.append({
+                    'bId': batch_item['bId'],
+                    'Fault': {'Error': [{'Message': 'Business Validation Error', 'code': '6000'}],
+                              'type': 'ValidationFault'}
+                })
+                continue
+
+            created_object = copy.deepcopy(sdk_response[qbo_object_type])
+            created_object['Id'] = '{0}-{1}'.format(created_object['Id'], index)
+            batch_item_responses.append({'bId': batch_item['bId'], qbo_object_type: created_object})
+
+        return {'BatchItemResponse': batch_item_responses}
+
+    return post_request
+
+
 def get_mock_qbo():
     """
     Get mock qbo with data
@@ -0,0 +1,114 @@
+"""
+Extract Cache Unit Tests
+"""
+import logging
+import os
+from urllib.parse import unquote
+
+import pytest
+
+from test.common.utilities import FakeClock, dbconn_table_num_rows, get_request_calls, mock_query_pages
+from qbo_db_connector import QuickbooksExtractConnector
+from qbo_db_connector.cache import ExtractCache, SQLiteCacheStore
+
+logger = logging.getLogger(__name__)
+
+
+def test_cache_within_ttl(qbo, dbconn):
+    """
+    Test repeated extracts within the TTL make no Quickbooks calls
+    """
+    clock = FakeClock(now=1000.0)
+    cache = ExtractCache(ttls={'accounts': 60, 'employees': 60}, clock=clock)
+    qec = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, realm_id='realm-1', cache=cache)
+    qec.create_tables()
+
+    account_ids = qec.extract_accounts()
+    qec.create_tables()
+    clock.now = clock.now + 59
+
+    assert qec.extract_accounts() == account_ids, 'cached ids should match'
+    assert qec.extract_all(entities=['accounts', 'employees'])['ids']['accounts'] == account_ids
+    assert get_request_calls(qbo.accounts) == 1, 'accounts should be served from cache'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == 67, 'cached accounts not written'
+
+    qec.extract_accounts(force_refresh=True)
+    assert get_request_calls(qbo.accounts) == 2, 'force refresh should bypass the cache'
+
+    cache.invalidate('realm-1', 'accounts')
+    qec.extract_accounts()
+    assert get_request_calls(qbo.accounts) == 3, 'invalidated entity should be fetched'
+
+    qec.extract_classes()
+    qec.extract_classes()
+    assert get_request_calls(qbo.classes) == 2, 'entities without a TTL should not be cached'
+
+
+def test_cache_expiry_checks_last_updated_time(qbo, dbconn):
+    """
+    Test expired entries are renewed when no record changed since their LastUpdatedTime
+    """
+    qbo.accounts.get.return_value = [
+        {'Id': '1', 'Name': 'Cash', 'MetaData': {'LastUpdatedTime': '2019-10-29T01:43:14-07:00'}},
+        {'Id': '2', 'Name': 'Travel', 'MetaData': {'LastUpdatedTime': '2019-10-30T01:43:14-07:00'}}
+    ]
+    change_counts = iter([{'totalCount': 0}, {'totalCount': 1}])
+    query_pages = mock_query_pages('Account', qbo.accounts.get)
+
+    def get_request(response_type, api_url):
+        return next(change_counts) if 'count(*)' in api_url else query_pages(response_type, api_url)
+
+    qbo.accounts._get_request.side_effect = get_request
+
+    clock = FakeClock(now=1000.0)
+    qec = QuickbooksExtractConnector(
+        qbo_connection=qbo, dbconn=dbconn, cache=ExtractCache(ttls={'accounts': 60}, clock=clock)
+    )
+    qec.create_tables()
+
+    qec.extract_accounts()
+    clock.now = clock.now + 61
+
+    assert qec.extract_accounts() == ['1', '2'], 'return value messed up'
+    assert get_request_calls(qbo.accounts) == 1, 'unchanged accounts should not be fetched'
+    query_url = qbo.accounts._get_request.call_args[0][1]
+    assert "MetaData.LastUpdatedTime > '2019-10-30T01:43:14-07:00'" in unquote(query_url), 'LastUpdatedTime not used'
+
+    clock.now = clock.now + 30
+    qec.extract_accounts()
+    assert get_request_calls(qbo.accounts, 'count(*)') == 1, 'renewed entry should be fresh'
+
+    clock.now = clock.now + 31
+    qec.extract_accounts()
+    assert get_request_calls(qbo.accounts) == 2, 'changed accounts should be fetched'
+
+
+def test_sqlite_cache_store(qbo, dbconn):
+    """
+    Test the on-disk store shares cached records across connectors
+    """
+    sqlite_db_file = '/tmp/test_qbo_cache.db'
+    if os.path.exists(sqlite_db_file):
+        os.remove(sqlite_db_file)
+
+    for _ in range(2):
+        cache = ExtractCache(store=SQLiteCacheStore(sqlite_db_file))
+        qec = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, realm_id='realm-1', cache=cache)
+        qec.create_tables()
+        assert len(qec.extract_departments()) == 14, 'return value messed up'
+
+    assert get_request_calls(qbo.departments) == 1, 'departments should be served from the on-disk cache'
+
+    cache.invalidate('realm-1')
+    assert cache.get('realm-1', 'departments') is None, 'realm entries should be invalidated'
+
+
+def test_cache_uncacheable_ttls():
+    """
+    Test TTLs are rejected for entities that cannot be queried for changes
+    """
+    with pytest.raises(AssertionError, match='exchange_rates'):
+        ExtractCache(ttls={'exchange_rates': 60})
+
+    with pytest.raises(AssertionError, match='home_currency'):
+        ExtractCache(ttls={'accounts': 60, 'home_currency': 60})
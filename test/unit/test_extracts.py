@@ -2,9 +2,13 @@
 Extract Unit Tests
 """
 import logging
+import sqlite3
+from urllib.parse import unquote
+
+import pytest
 
 from test.common.utilities import (dbconn_table_num_rows, dbconn_table_row_dict,
-                                   dict_compare_keys, get_mock_qbo_empty)
+                                   dict_compare_keys, get_mock_qbo_empty, get_request_calls, mock_query_pages)
 from qbo_db_connector import QuickbooksExtractConnector
 
 logger = logging.getLogger(__name__)
@@ -110,3 +114,357 @@ def test_empty(dbconn):
     assert res.extract_classes() == []
     assert res.extract_employees() == []
     assert res.extract_exchange_rates() == []
+
+
+def test_extract_all(qbo, qec, dbconn):
+    """
+    Test Extract All entities concurrently
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    result = qec.extract_all()
+
+    assert sorted(result['ids']) == sorted(QuickbooksExtractConnector.ENTITIES), 'entities missing in result'
+    assert len(result['ids']['accounts']) == 67, 'return value messed up'
+    assert len(result['ids']['employees']) == 7, 'return value messed up'
+    assert len(result['ids']['exchange_rates']) == 144, 'return value messed up'
+    assert result['ids']['home_currency'] == 'USD', 'return value messed up'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_departments') == len(qbo.departments.get()), \
+        'row count mismatch'
+    assert all(timing['fetch'] >= 0 and timing['write'] >= 0 for timing in result['timings'].values())
+
+
+def test_extract_all_subset(qbo, qec, dbconn):
+    """
+    Test Extract All with a subset of entities
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    result = qec.extract_all(entities=['accounts', 'classes'], max_workers=2)
+
+    assert sorted(result['ids']) == ['accounts', 'classes'], 'unexpected entities in result'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_classes') == 7, 'row count mismatch'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_employees') == 0, 'employees should not be extracted'
+    qbo.employees._get_request.assert_not_called()
+
+
+def test_extract_all_atomic(qbo, qec, dbconn):
+    """
+    Test an atomic Extract All writes nothing if an entity fails
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qbo.employees._get_request.side_effect = Exception('Error: 500')
+
+    with pytest.raises(Exception):
+        qec.extract_all(entities=['accounts', 'classes', 'employees'], atomic=True)
+
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == 0, 'accounts should be rolled back'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_classes') == 0, 'classes should be rolled back'
+
+
+def test_transaction_snapshot(qec, dbconn):
+    """
+    Test readers see the previous tables until the transaction commits
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    reader = sqlite3.connect('/tmp/test_qbo.db')
+
+    with qec.transaction(wal=True, synchronous='NORMAL'):
+        account_ids = qec.extract_accounts()
+        qec.extract_classes()
+        assert reader.execute('select count(*) from qbo_extract_accounts').fetchone()[0] == 0, \
+            'uncommitted accounts visible to readers'
+
+    assert reader.execute('select count(*) from qbo_extract_accounts').fetchone()[0] == len(account_ids), \
+        'committed accounts not visible to readers'
+    assert dbconn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal', 'journal mode not matching'
+    reader.close()
+    dbconn.execute('PRAGMA journal_mode=DELETE')
+
+
+def test_accounts_incremental(qbo, qec, dbconn):
+    """
+    Test incremental Extract of accounts
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    first_run = [
+        {'Id': '1', 'Name': 'Cash', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-10-29T01:43:14-07:00'}},
+        {'Id': '2', 'Name': 'Travel', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-10-30T01:43:14-07:00'}}
+    ]
+    second_run = [
+        {'Id': '1', 'Name': 'Cash on hand', 'Active': True,
+         'MetaData': {'LastUpdatedTime': '2019-11-01T10:00:00-07:00'}},
+        {'Id': '2', 'Name': 'Travel', 'Active': False, 'MetaData': {'LastUpdatedTime': '2019-11-02T10:00:00-07:00'}},
+        {'Id': '3', 'Name': 'Meals', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-11-01T09:00:00-07:00'}}
+    ]
+    qbo.accounts.get.return_value = first_run
+    assert qec.extract_accounts(incremental=True) == ['1', '2'], 'return value messed up'
+
+    qbo.accounts.get.return_value = second_run
+    assert qec.extract_accounts(incremental=True) == ['1', '3'], 'return value messed up'
+    query_url = qbo.accounts._get_request.call_args[0][1]
+    assert "MetaData.LastUpdatedTime >= '2019-10-30T01:43:14-07:00'" in unquote(query_url), 'watermark not used'
+
+    rows = dbconn.execute('select Id, Name from qbo_extract_accounts order by Id').fetchall()
+    assert rows == [('1', 'Cash on hand'), ('3', 'Meals')], 'changes not applied'
+
+    watermark = dbconn.execute('select last_updated_time from qbo_extract_watermarks').fetchall()
+    assert watermark == [('2019-11-02T10:00:00-07:00',)], 'watermark not moved forward'
+    assert get_request_calls(qbo.accounts, 'Active in (true, false)') == get_request_calls(qbo.accounts), \
+        'incremental extracts should query changes only'
+
+
+
+def test_watermarks_survive_create_tables(qbo, qec, dbconn):
+    """
+    Test create_tables keeps the watermarks, so the next incremental extract only asks for the changes
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract instance
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qbo.accounts.get.return_value = [
+        {'Id': '1', 'Name': 'Cash', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-10-29T01:43:14-07:00'}}
+    ]
+    qec.extract_accounts(incremental=True)
+    qec.create_tables()
+
+    watermark = dbconn.execute('select last_updated_time from qbo_extract_watermarks').fetchall()
+    assert watermark == [('2019-10-29T01:43:14-07:00',)], 'watermark dropped by create_tables'
+
+    qec.extract_accounts(incremental=True)
+    query_url = qbo.accounts._get_request.call_args[0][1]
+    assert "MetaData.LastUpdatedTime >= '2019-10-29T01:43:14-07:00'" in unquote(query_url), 'watermark not used'
+
+def test_extract_all_incremental(qbo, qec, dbconn):
+    """
+    Test incremental Extract of several entities on the pool, watermarks are read on the calling thread
+    since dbconn refuses to be used from the fetching threads
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qbo.accounts.get.return_value = [
+        {'Id': '1', 'Name': 'Cash', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-10-29T01:43:14-07:00'}}
+    ]
+    qbo.classes.get.return_value = [
+        {'Id': '5', 'Name': 'Sales', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-10-20T01:00:00-07:00'}}
+    ]
+
+    result = qec.extract_all(entities=['accounts', 'classes'], max_workers=2, incremental=True)
+    assert result['ids'] == {'accounts': ['1'], 'classes': ['5']}, 'first run ids not matching'
+
+    qbo.accounts.get.return_value = [
+        {'Id': '2', 'Name': 'Meals', 'Active': True, 'MetaData': {'LastUpdatedTime': '2019-11-01T09:00:00-07:00'}}
+    ]
+    qbo.classes.get.return_value = []
+    result = qec.extract_all(entities=['accounts', 'classes'], max_workers=2, incremental=True)
+    assert result['ids'] == {'accounts': ['2'], 'classes': []}, 'second run ids not matching'
+
+    query_url = qbo.accounts._get_request.call_args[0][1]
+    assert "MetaData.LastUpdatedTime >= '2019-10-29T01:43:14-07:00'" in unquote(query_url), 'watermark not used'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == 2, 'changes not applied'
+
+
+def test_incremental_watermark_encoded(qbo, qec):
+    """
+    Test watermarks with an offset east of UTC are percent-encoded in the query url
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :return: None
+    """
+    qbo.accounts.get.return_value = [
+        {'Id': '1', 'Name': 'Cash', 'Active': True, 'MetaData': {'LastUpdatedTime': '2021-01-01T10:00:00+05:30'}}
+    ]
+
+    qec.extract_accounts(incremental=True)
+    qec.extract_accounts(incremental=True)
+
+    query_url = qbo.accounts._get_request.call_args[0][1]
+    assert '+' not in query_url, 'offset sent unencoded'
+    assert "MetaData.LastUpdatedTime >= '2021-01-01T10%3A00%3A00%2B05%3A30'" in query_url, 'watermark not encoded'
+
+
+def test_stream_extract(qbo, qec, dbconn):
+    """
+    Test streaming Extract of accounts page by page
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qbo.accounts._get_request.side_effect = mock_query_pages('Account', qbo.accounts.get())
+
+    account_ids = qec.stream_extract('accounts', page_size=20)
+    assert qbo.accounts._get_request.call_count == 0, 'pages should be fetched lazily'
+
+    first_ids = [next(account_ids) for _ in range(20)]
+    assert qbo.accounts._get_request.call_count == 1, 'only the first page should be fetched'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == 20, 'first page not written'
+
+    account_ids = first_ids + list(account_ids)
+    assert account_ids == [account['Id'] for account in qbo.accounts.get()], 'return value messed up'
+    assert qbo.accounts._get_request.call_count == 4, 'unexpected number of pages'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == 67, 'row count mismatch'
+
+
+def test_page_size_capped(qbo, qec):
+    """
+    Test page sizes beyond the 1000 records Quickbooks returns per query are rejected instead of
+    silently stopping after the first page
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :return: None
+    """
+    qbo.accounts.get.return_value = [{'Id': str(account_id), 'Name': 'Account'} for account_id in range(2500)]
+
+    with pytest.raises(AssertionError, match='page_size'):
+        list(qec.stream_extract('accounts', page_size=2000))
+
+    with pytest.raises(AssertionError, match='page_size'):
+        qec.extract_changes('accounts', page_size=2000)
+
+    qbo.accounts._get_request.assert_not_called()
+    assert len(list(qec.stream_extract('accounts', page_size=1000))) == 2500, 'all pages should be extracted'
+
+
+def test_extract_changes(qbo, qec, dbconn):
+    """
+    Test Extract changes reports inserted / updated / deleted ids against the previous run
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    accounts = qbo.accounts.get()
+    qbo.accounts._get_request.side_effect = mock_query_pages('Account', accounts)
+
+    changes = qec.extract_changes('accounts', page_size=20)
+    assert sorted(changes['inserted']) == sorted(account['Id'] for account in accounts), 'first run inserts all'
+    assert not changes['updated'] and not changes['deleted'], 'first run has no updates or deletes'
+
+    changed_accounts = [dict(account) for account in accounts[1:]] + [{'Id': 'A-NEW', 'Name': 'New Account'}]
+    changed_accounts[0]['Name'] = 'Renamed Account'
+    qbo.accounts._get_request.side_effect = mock_query_pages('Account', changed_accounts)
+
+    changes = qec.extract_changes('accounts', page_size=20)
+    assert changes == {
+        'inserted': ['A-NEW'],
+        'updated': [changed_accounts[0]['Id']],
+        'deleted': [accounts[0]['Id']]
+    }, 'changes not matching'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == len(changed_accounts), 'row count mismatch'
+
+    qbo.accounts._get_request.side_effect = mock_query_pages('Account', changed_accounts)
+    changes = qec.extract_changes('accounts', page_size=20)
+    assert changes == {'inserted': [], 'updated': [], 'deleted': []}, 'unchanged run should report nothing'
+
+
+def test_repeated_extracts_upsert(qbo, qec, dbconn):
+    """
+    Test repeated Extracts replace rows keyed on Id / (Source, Target, AsOfDate) instead of appending
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qec.extract_all()
+    qbo.accounts.get.return_value = [{'Id': '140', 'Name': '5900 Misc Costs - renamed'}]
+    qec.extract_all()
+
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_accounts') == 67, 'accounts duplicated'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_employees') == 7, 'employees duplicated'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_exchange_rates') == 144, 'exchange rates duplicated'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_home_currency') == 1, 'home currency duplicated'
+
+    account = dbconn.execute("select Name from qbo_extract_accounts where Id = '140'").fetchone()
+    assert account['Name'] == '5900 Misc Costs - renamed', 'account not updated'
+
+    query_plan = dbconn.execute("explain query plan select * from qbo_extract_accounts where Id = '140'").fetchall()
+    assert 'USING INDEX' in str(query_plan), 'id lookups should use the primary key index'
+
+
+def test_exchange_rates_range(qbo, qec, dbconn):
+    """
+    Test backfill of exchange rates over a date range
+    :param qbo: mock qbo sdk object
+    :param qec: qbo extract connection
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qec.extract_exchange_rates()
+
+    def exchange_rates_of_day(object_type, api_url):
+        assert object_type == 'ExchangeRate', 'unexpected object type'
+        as_of_date = api_url.split("AsOfDate = '")[1][:10]
+        return [
+            {'SourceCurrencyCode': 'EUR', 'TargetCurrencyCode': 'USD', 'Rate': 1.1, 'AsOfDate': as_of_date},
+            {'SourceCurrencyCode': 'GBP', 'TargetCurrencyCode': 'USD', 'Rate': 1.3, 'AsOfDate': as_of_date}
+        ]
+
+    qbo.exchange_rates._query_get_all.side_effect = exchange_rates_of_day
+
+    exchange_rates = qec.extract_exchange_rates_range('2019-12-14', '2019-12-18', max_workers=3)
+
+    as_of_dates = sorted({exchange_rate['AsOfDate'] for exchange_rate in exchange_rates})
+    assert as_of_dates == ['2019-12-14', '2019-12-15', '2019-12-17', '2019-12-18'], \
+        'already extracted 2019-12-16 should be skipped'
+    assert len(exchange_rates) == 8, 'return value messed up'
+    assert qbo.exchange_rates._query_get_all.call_count == 4, 'one call per missing day expected'
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_exchange_rates') == 144 + 8, 'row count mismatch'
+
+    assert qec.extract_exchange_rates_range('2019-12-14', '2019-12-18') == [], 'nothing left to backfill'
+    assert qbo.exchange_rates._query_get_all.call_count == 4, 'extracted days should not be fetched again'
+
+
+def test_extract_columns_follow_ddl():
+    """
+    Test the extract columns are read from extract_ddl.sql
+    :return: None
+    """
+    assert QuickbooksExtractConnector.EXTRACT_COLUMNS['accounts'] == ['Id', 'Name']
+    assert QuickbooksExtractConnector.EXTRACT_COLUMNS['employees'] == ['Id', 'GivenName', 'FamilyName', 'DisplayName']
+    assert QuickbooksExtractConnector.EXTRACT_COLUMNS['exchange_rates'] == \
+        ['SourceCurrencyCode', 'TargetCurrencyCode', 'Rate', 'AsOfDate']
+    assert sorted(QuickbooksExtractConnector.EXTRACT_COLUMNS) == sorted(QuickbooksExtractConnector.ENTITIES), \
+        'only the entity tables should be read'
+
+
+def test_projection(qbo, dbconn):
+    """
+    Test projection mode queries only the extract table columns
+    :param qbo: mock qbo sdk object
+    :param dbconn: sqlite db connection
+    :return: None
+    """
+    qbo.employees.get.return_value = [
+        {'Id': '55', 'DisplayName': 'Ashwin', 'GivenName': 'Ashwin', 'FamilyName': 'T'}
+    ]
+
+    res = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, projection=True)
+    res.create_tables()
+
+    assert res.extract_employees() == ['55'], 'return value messed up'
+    query_url = qbo.employees._get_request.call_args[0][1]
+    assert query_url.startswith('/query?query=select Id, GivenName, FamilyName, DisplayName, MetaData from Employee '), \
+        'employees query should select the extract table columns'
+    qbo.employees.get.assert_not_called()
+
+    assert len(list(res.stream_extract('accounts'))) == 67, 'return value messed up'
+    assert qbo.accounts._get_request.call_args[0][1].startswith('/query?query=select Id, Name, MetaData from Account ')
+
+    res.extract_exchange_rates()
+    qbo.exchange_rates.get.assert_called_once_with()
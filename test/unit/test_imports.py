@@ -0,0 +1,54 @@
+"""
+Import Time Unit Tests
+"""
+import logging
+import subprocess
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def import_time(statement):
+    """
+    Run a statement in a fresh interpreter with -X importtime
+    :param statement: python statement to run
+    :return: Dict of imported module name to cumulative import time in microseconds
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        modules[module.strip()] = int(cumulative)
+
+    return modules
+
+
+def test_package_import_is_lazy():
+    """
+    Importing the package should not import the connectors or their heavy dependencies
+    """
+    modules = import_time('import qbo_db_connector')
+    logger.info('qbo_db_connector imported in %sus', modules['qbo_db_connector'])
+
+    assert 'qbo_db_connector.extract' not in modules, 'extract connector imported eagerly'
+    assert 'qbo_db_connector.load' not in modules, 'load connector imported eagerly'
+    assert 'pandas' not in modules, 'pandas imported on package import'
+
+
+def test_connector_import_does_not_need_pandas():
+    """
+    Importing the connectors should not import pandas or qbosdk
+    """
+    modules = import_time(
+        'from qbo_db_connector import QuickbooksExtractConnector, QuickbooksLoadConnector'
+    )
+    logger.info('connectors imported in %sus', modules['qbo_db_connector.load'] + modules['qbo_db_connector.extract'])
+
+    assert 'pandas' not in modules, 'pandas imported with the connectors'
+    assert 'qbosdk' not in modules, 'qbosdk imported with the connectors'
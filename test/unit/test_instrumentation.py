@@ -0,0 +1,80 @@
+"""
+Instrumentation Unit Tests
+"""
+import json
+import logging
+
+import pytest
+
+from qbo_db_connector import QuickbooksExtractConnector, QuickbooksLoadConnector
+from qbo_db_connector.instrumentation import StageObserver, StageTimingCollector
+
+logger = logging.getLogger(__name__)
+
+
+def test_collector_percentiles():
+    """
+    Test the collector aggregates durations and rows per span
+    """
+    collector = StageTimingCollector()
+    for duration in range(1, 101):
+        collector.on_span('accounts.qbo_api', duration / 1000.0, 10)
+
+    summary = collector.summary()['accounts.qbo_api']
+    assert summary['count'] == 100, 'span count not matching'
+    assert summary['rows'] == 1000, 'span rows not matching'
+    assert summary['p50'] == 0.05, 'p50 not matching'
+    assert summary['p95'] == 0.095, 'p95 not matching'
+    assert summary['p99'] == 0.099, 'p99 not matching'
+
+    assert json.loads(collector.to_json()) == collector.summary(), 'json summary not matching'
+
+    prometheus = collector.to_prometheus()
+    assert 'qbo_connector_stage_duration_seconds{stage="accounts.qbo_api",quantile="0.95"} 0.095' in prometheus
+    assert 'qbo_connector_stage_duration_seconds_count{stage="accounts.qbo_api"} 100' in prometheus
+    assert 'qbo_connector_stage_rows_total{stage="accounts.qbo_api"} 1000' in prometheus
+
+
+def test_extract_spans(qbo, dbconn):
+    """
+    Test the extract connector reports its Quickbooks and database stages
+    """
+    collector = StageTimingCollector()
+    extract_connector = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, observers=[collector])
+    extract_connector.create_tables()
+
+    account_ids = extract_connector.extract_accounts()
+
+    summary = collector.summary()
+    assert set(summary) == {'accounts.qbo_api', 'accounts.transform', 'accounts.db_write'}, 'spans not matching'
+    assert summary['accounts.qbo_api']['rows'] == len(account_ids), 'qbo_api rows not matching'
+    assert summary['accounts.db_write']['rows'] == len(account_ids), 'db_write rows not matching'
+
+
+def test_load_spans(qbo, dbconn):
+    """
+    Test the load connector reports its database, payload and Quickbooks stages
+    """
+    collector = StageTimingCollector()
+    load_connector = QuickbooksLoadConnector(qbo_connection=qbo, dbconn=dbconn, observers=[collector])
+    load_connector.create_tables()
+    dbconn.executescript(open('./test/common/mock_db_load.sql').read())
+
+    load_connector.load_check(check_id='C1')
+
+    summary = collector.summary()
+    assert set(summary) == {'checks.db_read', 'checks.build_payload', 'checks.qbo_api'}, 'spans not matching'
+    assert summary['checks.qbo_api']['count'] == 1, 'qbo_api count not matching'
+
+
+def test_observer_interface():
+    """
+    Test observers must implement on_span
+    """
+    class IncompleteObserver(StageObserver):  # pylint: disable=too-few-public-methods
+        """
+        Observer without on_span
+        """
+
+    with pytest.raises(TypeError):
+        IncompleteObserver()  # pylint: disable=abstract-class-instantiated
@@ -1,12 +1,27 @@
 """
 QBO Load Unit Tests
 """
+import base64
+import copy
+import itertools
 import logging
+import re
 
-from test.common.utilities import dbconn_get_load_object_by_id
+import pytest
+from qbosdk.apis.attachments import Attachments
+from qbosdk.exceptions import NotFoundItemError, WrongParamsError
+
+from test.common.utilities import dbconn_get_load_object_by_id, dbconn_table_num_rows, get_mock_qbo_dict, \
+    mock_batch_post
 
 logger = logging.getLogger(__name__)
 
+# 400 response text of Quickbooks for a deleted object
+OBJECT_NOT_FOUND_FAULT = (
+    '{"Fault":{"Error":[{"Message":"Object Not Found","Detail":"Object Not Found : Something you\'re trying to use '
+    'has been made inactive.","code":"610","element":""}],"type":"ValidationFault"}}'
+)
+
 
 def test_get_qbo_load_check(qlc, dbconn):
     """
@@ -32,3 +47,316 @@ def test_get_qbo_load_journal_entry(qlc, dbconn):
 
     response = qlc.load_journal_entry(journal_entry_id='J1')
     assert response['id'] == '1467', 'qbo check id not matching'
+
+
+def test_load_checks_batch(qbo, qlc, dbconn):
+    """
+    Checks batch load Unit Test
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    sdk_response = get_mock_qbo_dict('mock_qbo.json')['check_sdk_response']
+    qbo.purchases._post_request.side_effect = mock_batch_post('Purchase', sdk_response, fault_ids=('C2',))
+
+    results = qlc.load_checks(check_ids=['C1', 'C2', 'C3'], batch_size=2)
+
+    assert list(results) == ['C1', 'C2', 'C3'], 'results not keyed on check ids'
+    assert results['C1']['success'] and results['C1']['response']['id'] == '1453-0', 'qbo check id not matching'
+    assert not results['C2']['success'] and results['C2']['error']['type'] == 'ValidationFault', 'fault not mapped'
+    assert not results['C3']['success'], 'missing check should fail'
+    assert qbo.purchases._post_request.call_count == 1, 'C3 should not be posted'
+    qbo.purchases.post.assert_not_called()
+
+
+def test_load_journal_entries_batch(qbo, qlc, dbconn):
+    """
+    Journal entries batch load Unit Test
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    sdk_response = get_mock_qbo_dict('mock_qbo.json')['journal_entry_sdk_response']
+    qbo.journal_entries._post_request.side_effect = mock_batch_post('JournalEntry', sdk_response)
+
+    results = qlc.load_journal_entries(journal_entry_ids=['J1', 'J2'], batch_size=1)
+
+    assert all(result['success'] for result in results.values()), 'journal entries should be loaded'
+    assert qbo.journal_entries._post_request.call_count == 2, 'one batch request per journal entry expected'
+    batch_request = qbo.journal_entries._post_request.call_args[0][0]['BatchItemRequest']
+    assert batch_request[0]['bId'] == 'J2' and batch_request[0]['operation'] == 'create', 'batch item not matching'
+
+
+def test_load_concurrently(qbo, qlc, dbconn):
+    """
+    Concurrent checks load Unit Test
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    check_response = qbo.purchases._post_request.return_value
+
+    def post_request(check, _):
+        if check['TxnDate'] == '2019-09-26':
+            raise Exception('Error: 400')
+        return check_response
+
+    qbo.purchases._post_request.side_effect = post_request
+
+    results = dict(qlc.load_concurrently('checks', ['C1', 'C2', 'C3'], max_workers=2))
+
+    assert sorted(results) == ['C1', 'C2', 'C3'], 'every check should have a result'
+    assert results['C1']['success'] and results['C1']['response']['id'] == '1453', 'qbo check id not matching'
+    assert not results['C2']['success'] and 'Error: 400' in results['C2']['error'], 'post failure not isolated'
+    assert not results['C3']['success'], 'missing check should fail'
+    assert qbo.purchases._post_request.call_count == 2, 'missing check should not be posted'
+
+
+def test_load_checks_prefetch(qbo, qlc, dbconn):
+    """
+    Checks batch load reads all headers and line items in two queries
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    sdk_response = get_mock_qbo_dict('mock_qbo.json')['check_sdk_response']
+    qbo.purchases._post_request.side_effect = mock_batch_post('Purchase', sdk_response)
+
+    statements = []
+    dbconn.set_trace_callback(statements.append)
+    qlc.load_checks(check_ids=['C1', 'C2'])
+    dbconn.set_trace_callback(None)
+
+    assert len([statement for statement in statements if 'FROM QBO_LOAD_CHECK' in statement.upper()]) == 2, \
+        'headers and line items should be read in one query each'
+
+    batch_request = qbo.purchases._post_request.call_args[0][0]['BatchItemRequest']
+    assert [item['Purchase']['TxnDate'] for item in batch_request] == ['2019-09-25', '2019-09-26'], \
+        'checks not matching'
+    assert [[line['Amount'] for line in item['Purchase']['Line']] for item in batch_request] == \
+        [[23.98, 675.0], [231.981, 635.0]], 'line items not grouped per check'
+
+
+def test_load_checks_chunked(qbo, qlc, dbconn):
+    """
+    Checks batch load posts each prefetch chunk before reading the next one
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    events = []
+    sdk_response = get_mock_qbo_dict('mock_qbo.json')['check_sdk_response']
+    batch_post = mock_batch_post('Purchase', sdk_response)
+
+    def post_request(data, api_url):
+        events.append('post {0}'.format([item['bId'] for item in data['BatchItemRequest']]))
+        return batch_post(data, api_url)
+
+    qbo.purchases._post_request.side_effect = post_request
+    dbconn.set_trace_callback(
+        lambda statement: events.append('read') if 'FROM QBO_LOAD_CHECKS ' in statement.upper() else None
+    )
+    qlc.PREFETCH_SIZE = 1
+    results = qlc.load_checks(check_ids=['C1', 'C2'])
+    dbconn.set_trace_callback(None)
+
+    assert events == ['read', "post ['C1']", 'read', "post ['C2']"], 'chunks should be posted as they are read'
+    assert all(result['success'] for result in results.values()), 'checks should be loaded'
+
+
+def test_load_state_resume(qbo, qlc, dbconn):
+    """
+    Bulk loads record their results and skip checks loaded by a previous run
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    sdk_response = get_mock_qbo_dict('mock_qbo.json')['check_sdk_response']
+    qbo.purchases._post_request.side_effect = mock_batch_post('Purchase', sdk_response, fault_ids=('C2',))
+
+    qlc.load_checks(check_ids=['C1', 'C2'])
+
+    states = {state['source_id']: state for state in qlc.load_states('checks')}
+    assert states['C1']['status'] == 'success' and states['C1']['qbo_id'] == '1453-0', 'C1 state not matching'
+    assert states['C2']['status'] == 'failed' and 'ValidationFault' in states['C2']['error'], 'C2 state not matching'
+
+    qbo.purchases._post_request.side_effect = mock_batch_post('Purchase', sdk_response)
+    results = qlc.load_checks(check_ids=['C1', 'C2'])
+
+    assert results['C1']['skipped'] and results['C1']['response']['id'] == '1453-0', 'C1 should be skipped'
+    assert results['C2']['success'] and not results['C2'].get('skipped'), 'C2 should be loaded again'
+    batch_request = qbo.purchases._post_request.call_args[0][0]['BatchItemRequest']
+    assert [item['bId'] for item in batch_request] == ['C2'], 'only C2 should be posted'
+
+    results = dict(qlc.load_concurrently('checks', ['C1', 'C2']))
+    assert all(result['skipped'] for result in results.values()), 'loaded checks should be skipped'
+    assert [state['status'] for state in qlc.load_states('checks', ['C1', 'C2'])] == ['success', 'success']
+
+
+def test_load_check_leaves_state_alone(qbo, qlc, dbconn):
+    """
+    Single loads neither need qbo_load_state nor commit the transaction of the caller
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+    dbconn.execute('drop table qbo_load_state')
+
+    dbconn.execute('create table caller_rows (id TEXT)')
+    dbconn.execute("insert into caller_rows (id) values ('1')")
+    assert qlc.load_check(check_id='C1')['id'] == '1453', 'check should load without qbo_load_state'
+    assert dbconn.in_transaction, 'transaction of the caller should stay open'
+    dbconn.rollback()
+
+    qbo.purchases._post_request.side_effect = WrongParamsError('Some of the parameters are wrong', '{}')
+    with pytest.raises(WrongParamsError):
+        qlc.load_check(check_id='C1')
+
+
+def test_load_check_request_id(qbo, qlc, dbconn):
+    """
+    Check posts carry a requestid derived from the check id and payload, identical across retries
+    """
+    sql = open('./test/common/mock_db_load.sql').read()
+    dbconn.executescript(sql)
+
+    qlc.load_check(check_id='C1')
+    qlc.load_check(check_id='C1')
+    qlc.load_check(check_id='C1', custom_doc_number='D1')
+    qlc.load_check(check_id='C2')
+
+    urls = [call[0][1] for call in qbo.purchases._post_request.call_args_list]
+    assert all(url.startswith('/purchase?minorversion=38&requestid=') for url in urls), 'requestid not sent'
+    assert urls[0] == urls[1], 'requestid should not change when the same check is posted again'
+    assert len(set(urls)) == 3, 'requestid should change with the payload and the check id'
+    qbo.purchases.post.assert_not_called()
+
+
+def test_load_attachments_streamed(qbo, qlc, dbconn, tmp_path):
+    """
+    Attachments stored as file paths, BLOBs and base64 text are uploaded with the body qbosdk would build
+    """
+    content = bytes(range(256)) * 1000
+    file_path = tmp_path / 'receipt.pdf'
+    file_path.write_bytes(content)
+
+    dbconn.executemany(
+        'insert into qbo_load_attachments (ref_id, prep_id, ref_type, filename, content, content_blob, file_path) '
+        'values (?, ?, ?, ?, ?, ?, ?)',
+        [
+            ('C1', 'P1', 'Purchase', 'receipt.pdf', None, None, str(file_path)),
+            ('C1', 'P1', 'Purchase', 'receipt.png', None, content[:1000], None),
+            ('C1', 'P1', 'Purchase', 'receipt.jpg', base64.b64encode(content[:10]).decode(), None, None),
+            ('C1', 'P1', 'Purchase', 'receipt.exe', None, content[:10], None)
+        ]
+    )
+    dbconn.commit()
+
+    bodies = []
+
+    def post_file(data, api_url):
+        body = data.read()
+        assert api_url == '/upload' and len(body) == len(data), 'Content-Length not matching the body'
+        bodies.append(body)
+        return {'Id': str(len(body)), 'FileName': 'receipt'}
+
+    qbo.attachments._post_file.side_effect = post_file
+    qbo.attachments._post_request.side_effect = lambda data, api_url: {'Attachable': data}
+
+    responses = qlc.load_attachments(ref_id='1453', ref_type='Purchase', prep_id='P1', max_workers=2)
+
+    assert len(responses) == 3, 'unsupported file types should be skipped'
+    assert all(response['Attachable']['AttachableRef'][0]['EntityRef']['value'] == '1453' for response in responses)
+
+    expected_bodies = []
+    sdk_attachments = Attachments()
+    sdk_attachments._post_file = lambda data, api_url: expected_bodies.append(data.encode('utf-8'))
+    for file_name, file_content in [('receipt.pdf', content), ('receipt.png', content[:1000]),
+                                    ('receipt.jpg', content[:10])]:
+        sdk_attachments._Attachments__upload_file(base64.b64encode(file_content).decode(), file_name)
+
+    assert sorted(bodies) == sorted(expected_bodies), 'streamed bodies differ from the qbosdk bodies'
+    assert [response['Attachable']['Id'] for response in responses] == [str(len(body)) for body in expected_bodies], \
+        'responses not in row order'
+
+
+def test_load_attachments_dedup(qbo, qlc, dbconn, tmp_path):
+    """
+    Attachments with the same content are uploaded once per realm and linked to the other objects
+    """
+    content = bytes(range(256)) * 10
+    file_path = tmp_path / 'copy.pdf'
+    file_path.write_bytes(content)
+
+    dbconn.executemany(
+        'insert into qbo_load_attachments (ref_id, prep_id, ref_type, filename, content, content_blob, file_path) '
+        'values (?, ?, ?, ?, ?, ?, ?)',
+        [
+            ('C1', 'P1', 'Purchase', 'receipt.png', None, content, None),
+            ('C1', 'P1', 'Purchase', 'copy.pdf', None, None, str(file_path)),
+            ('C1', 'P1', 'Purchase', 'copy.jpg', base64.b64encode(content).decode(), None, None),
+            ('C1', 'P1', 'Purchase', 'other.png', None, content[:10], None)
+        ]
+    )
+    dbconn.commit()
+
+    attachables = {}
+    attachable_ids = itertools.count(1)
+
+    def post_file(data, _):
+        data.read()
+        attachable_id = str(next(attachable_ids))
+        attachables[attachable_id] = {'Id': attachable_id, 'SyncToken': '0'}
+        return copy.deepcopy(attachables[attachable_id])
+
+    def post_request(data, api_url):
+        assert api_url.startswith('/attachable?minorversion=38&requestid='), 'requestid not sent'
+        attachables[data['Id']]['AttachableRef'] = data['AttachableRef']
+        return {'Attachable': copy.deepcopy(attachables[data['Id']])}
+
+    def get_request(object_type, api_url):
+        attachable_id = re.match(r'/attachable/(\w+)\?', api_url).group(1)
+        if object_type != 'Attachable' or attachable_id not in attachables:
+            raise NotFoundItemError('Not found item with ID', '')
+        return copy.deepcopy(attachables[attachable_id])
+
+    qbo.attachments._post_file.side_effect = post_file
+    qbo.attachments._post_request.side_effect = post_request
+    qbo.attachments._get_request.side_effect = get_request
+
+    responses = qlc.load_attachments(ref_id='1453', ref_type='Purchase', prep_id='P1', max_workers=2)
+
+    ids = [response['Attachable']['Id'] for response in responses]
+    assert ids[0] == ids[1] == ids[2] != ids[3], 'same content should share its Attachable'
+    assert qbo.attachments._post_file.call_count == 2, 'same content should be uploaded once'
+
+    responses = qlc.load_attachments(ref_id='1454', ref_type='Purchase', prep_id='P1', max_workers=2)
+
+    assert [response['Attachable']['Id'] for response in responses] == ids, 'Attachables should be reused'
+    assert qbo.attachments._post_file.call_count == 2, 'uploaded content should not be uploaded again'
+    assert [ref['EntityRef']['value'] for ref in attachables[ids[0]]['AttachableRef']] == ['1453', '1454'], \
+        'Attachable should be linked to both objects'
+
+    del attachables[ids[3]]
+    responses = qlc.load_attachments(ref_id='1455', ref_type='Purchase', prep_id='P1', max_workers=2)
+
+    assert qbo.attachments._post_file.call_count == 3, 'deleted Attachable should be uploaded again'
+    assert responses[3]['Attachable']['Id'] not in ids, 'new Attachable expected'
+    assert dbconn_table_num_rows(dbconn, 'qbo_attachment_uploads') == 2, 'uploads should be recorded per content'
+
+    def get_request_fault(object_type, api_url):
+        attachable_id = re.match(r'/attachable/(\w+)\?', api_url).group(1)
+        if attachable_id not in attachables:
+            raise WrongParamsError('Some of the parameters are wrong', OBJECT_NOT_FOUND_FAULT)
+        return get_request(object_type, api_url)
+
+    qbo.attachments._get_request.side_effect = get_request_fault
+    del attachables[ids[0]]
+    responses = qlc.load_attachments(ref_id='1456', ref_type='Purchase', prep_id='P1', max_workers=2)
+
+    assert qbo.attachments._post_file.call_count == 4, 'Attachable reported Object Not Found should be uploaded again'
+    assert responses[0]['Attachable']['Id'] == responses[1]['Attachable']['Id'] == responses[2]['Attachable']['Id'], \
+        'same content should share the new Attachable'
+
+    qbo.attachments._get_request.side_effect = WrongParamsError('Some of the parameters are wrong', '{}')
+    with pytest.raises(WrongParamsError):
+        qlc.load_attachments(ref_id='1457', ref_type='Purchase', prep_id='P1', max_workers=2)
@@ -0,0 +1,91 @@
+"""
+Rate Limiter Unit Tests
+"""
+import logging
+import threading
+import time
+
+from test.common.utilities import FakeClock
+from qbo_db_connector import QuickbooksExtractConnector, QuickbooksLoadConnector
+from qbo_db_connector.rate_limiter import RateLimiter, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def test_token_bucket():
+    """
+    Test calls beyond the burst wait for the bucket to refill
+    """
+    clock = FakeClock()
+    rate_limiter = RateLimiter(requests_per_minute=60, max_concurrent=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(5):
+        rate_limiter.call(lambda: None)
+
+    assert clock.sleeps == [1.0, 1.0, 1.0], 'calls beyond the burst should wait one second each'
+
+    metrics = rate_limiter.metrics()
+    assert metrics['calls'] == 5, 'calls not counted'
+    assert metrics['throttled_calls'] == 3, 'throttled calls not counted'
+    assert metrics['wait_time'] == 3.0, 'wait time not measured'
+    assert metrics['max_wait_time'] == 1.0, 'max wait time not measured'
+
+
+def test_concurrency_limit():
+    """
+    Test no more than max_concurrent calls are in flight
+    """
+    rate_limiter = RateLimiter(requests_per_minute=60000, max_concurrent=2, burst=100)
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+
+    def sdk_call():
+        with lock:
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.pop()
+
+    threads = [threading.Thread(target=rate_limiter.call, args=(sdk_call,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(max_in_flight) == 2, 'concurrency limit not respected'
+    assert rate_limiter.metrics()['throttled_calls'] >= 6, 'calls waiting for a slot should be throttled'
+
+
+def test_connectors_share_realm_rate_limiter(qbo, dbconn):
+    """
+    Test extract and load connectors of a realm make their SDK calls through the shared limiter
+    """
+    rate_limiter = get_rate_limiter('realm-1', requests_per_minute=6000)
+    assert get_rate_limiter('realm-1') is rate_limiter, 'realm rate limiter should be shared'
+
+    qec = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, rate_limiter=rate_limiter)
+    qec.create_tables()
+    qec.extract_all(entities=['accounts', 'classes', 'employees'])
+
+    qlc = QuickbooksLoadConnector(qbo_connection=qbo, dbconn=dbconn, rate_limiter=get_rate_limiter('realm-1'))
+    qlc.create_tables()
+    dbconn.executescript(open('./test/common/mock_db_load.sql').read())
+    qlc.load_check(check_id='C1')
+
+    assert rate_limiter.metrics()['calls'] == 4, 'SDK calls should go through the rate limiter'
+
+
+def test_full_extract_takes_token_per_page(qbo, dbconn):
+    """
+    Test every page of a full extract takes its own token
+    """
+    qbo.accounts.get.return_value = [{'Id': str(account_id), 'Name': 'Account'} for account_id in range(2500)]
+    rate_limiter = RateLimiter(requests_per_minute=6000)
+
+    qec = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, rate_limiter=rate_limiter)
+    qec.create_tables()
+
+    assert len(qec.extract_accounts()) == 2500, 'return value messed up'
+    assert rate_limiter.metrics()['calls'] == 3, 'each page should take a token'
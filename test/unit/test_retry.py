@@ -0,0 +1,199 @@
+"""
+Retry Policy and Circuit Breaker Unit Tests
+"""
+import logging
+import threading
+
+import pytest
+
+from test.common.utilities import FakeClock, get_mock_qbo_dict
+from qbo_db_connector import QuickbooksLoadConnector
+from qbo_db_connector.rate_limiter import RateLimiter
+from qbo_db_connector.retry import CircuitBreaker, CircuitOpenError, RetryPolicy, guarded, is_transient_error
+
+logger = logging.getLogger(__name__)
+
+
+class QuickbooksError(Exception):
+    """
+    Error raised like qbosdk errors, with a message and the response text
+    """
+    def __init__(self, message, response=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.response = response
+        if retry_after is not None:
+            self.retry_after = retry_after
+
+
+class InternalServerError(QuickbooksError):
+    """
+    Same name as the qbosdk 500 error
+    """
+
+
+def flaky(failures):
+    """
+    Function failing with the given errors before succeeding
+    """
+    calls = []
+
+    def function():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return 'ok'
+
+    function.calls = calls
+    return function
+
+
+def test_transient_errors():
+    """
+    Test 429, 5xx and connection errors are transient and 4xx are not
+    """
+    assert is_transient_error(QuickbooksError('Error: 429'))
+    assert is_transient_error(QuickbooksError('Error: 503'))
+    assert is_transient_error(InternalServerError('Internal server error'))
+    assert is_transient_error(ConnectionError('connection reset'))
+    assert not is_transient_error(QuickbooksError('Some of the parameters are wrong'))
+    assert not is_transient_error(QuickbooksError('Error: 409'))
+
+
+def test_retry_backoff():
+    """
+    Test exponential backoff with jitter, honoring Retry-After
+    """
+    clock = FakeClock()
+    retry_policy = RetryPolicy(max_retries=3, base_delay=1, sleep=clock.sleep, rand=lambda: 0.5)
+
+    function = flaky([QuickbooksError('Error: 429'), InternalServerError('500'),
+                      QuickbooksError('Error: 429', retry_after=7)])
+    assert retry_policy.call(function) == 'ok'
+    assert clock.sleeps == [0.5, 1.0, 7.0], 'backoff delays not matching'
+
+    function = flaky([QuickbooksError('Some of the parameters are wrong')])
+    with pytest.raises(QuickbooksError):
+        retry_policy.call(function)
+    assert len(function.calls) == 1, 'non transient errors should not be retried'
+
+    function = flaky([QuickbooksError('Error: 503')] * 5)
+    with pytest.raises(QuickbooksError):
+        retry_policy.call(function)
+    assert len(function.calls) == 4, 'calls should stop after max_retries'
+
+    assert retry_policy.metrics() == {'calls': 3, 'retries': 6, 'retry_wait_time': 12.0, 'exhausted': 1}
+
+
+def test_circuit_breaker():
+    """
+    Test the circuit opens after consecutive failures and closes after a successful trial call
+    """
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(QuickbooksError):
+            circuit_breaker.call(flaky([QuickbooksError('Error: 503')]))
+
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.call(flaky([]))
+    assert circuit_breaker.metrics()['state'] == CircuitBreaker.OPEN
+
+    clock.sleep(10)
+    with pytest.raises(QuickbooksError):
+        circuit_breaker.call(flaky([QuickbooksError('Error: 503')]))
+    assert circuit_breaker.metrics()['state'] == CircuitBreaker.OPEN, 'failed trial should open the circuit again'
+
+    clock.sleep(10)
+    assert circuit_breaker.call(flaky([])) == 'ok'
+    assert circuit_breaker.metrics() == {'state': CircuitBreaker.CLOSED, 'opened': 2, 'rejected_calls': 1,
+                                         'open_time': 20.0}
+
+
+def test_circuit_breaker_trial_call():
+    """
+    Test a call started before the circuit opened does not count as the trial call when it ends
+    """
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    slow_call_started = threading.Event()
+    slow_call_release = threading.Event()
+    trial_started = threading.Event()
+    trial_release = threading.Event()
+
+    def slow_call():
+        slow_call_started.set()
+        slow_call_release.wait(5)
+        raise QuickbooksError('Error: 503')
+
+    def trial_call():
+        trial_started.set()
+        trial_release.wait(5)
+        return 'ok'
+
+    slow_thread = threading.Thread(target=lambda: pytest.raises(QuickbooksError, circuit_breaker.call, slow_call))
+    slow_thread.start()
+    slow_call_started.wait(5)
+
+    with pytest.raises(QuickbooksError):
+        circuit_breaker.call(flaky([QuickbooksError('Error: 503')]))
+    clock.sleep(10)
+
+    trial_thread = threading.Thread(target=circuit_breaker.call, args=(trial_call,))
+    trial_thread.start()
+    trial_started.wait(5)
+
+    slow_call_release.set()
+    slow_thread.join()
+    assert circuit_breaker.metrics()['state'] == CircuitBreaker.HALF_OPEN, 'only the trial call should end half open'
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.call(flaky([]))
+
+    trial_release.set()
+    trial_thread.join()
+    assert circuit_breaker.metrics()['state'] == CircuitBreaker.CLOSED, 'successful trial should close the circuit'
+
+
+def test_guarded_attempts():
+    """
+    Test every retry attempt goes through the circuit breaker and takes a rate limiter token
+    """
+    clock = FakeClock()
+    rate_limiter = RateLimiter(requests_per_minute=6000)
+    circuit_breaker = CircuitBreaker(failure_threshold=5)
+
+    function = flaky([InternalServerError('500'), InternalServerError('500')])
+    guarded_function = guarded(function, RetryPolicy(max_retries=3, sleep=clock.sleep), circuit_breaker, rate_limiter)
+
+    assert guarded_function() == 'ok'
+    assert len(function.calls) == 3, 'function should be attempted three times'
+    assert rate_limiter.metrics()['calls'] == 3, 'each attempt should take a token'
+    assert circuit_breaker.metrics()['state'] == CircuitBreaker.CLOSED, 'success should reset the failures'
+    assert guarded(function)() == 'ok', 'unguarded function should be called as is'
+
+
+def test_load_retries(qbo, dbconn):
+    """
+    Test the load connector retries transient failures and does not retry while the circuit is open
+    """
+    clock = FakeClock()
+    load_connector = QuickbooksLoadConnector(
+        qbo_connection=qbo, dbconn=dbconn,
+        retry_policy=RetryPolicy(max_retries=2, sleep=clock.sleep),
+        circuit_breaker=CircuitBreaker(failure_threshold=3, clock=clock)
+    )
+    load_connector.create_tables()
+    dbconn.executescript(open('./test/common/mock_db_load.sql').read())
+
+    check_response = get_mock_qbo_dict('mock_qbo.json')['check_sdk_response']
+    qbo.purchases._post_request.side_effect = [QuickbooksError('Error: 429'), check_response]
+    assert load_connector.load_check(check_id='C1')['id'] == '1453', 'check should be loaded after a retry'
+
+    qbo.purchases._post_request.side_effect = QuickbooksError('Error: 503')
+    with pytest.raises(QuickbooksError):
+        load_connector.load_check(check_id='C1')
+    with pytest.raises(CircuitOpenError):
+        load_connector.load_check(check_id='C2')
+
+    assert qbo.purchases._post_request.call_count == 5, 'calls should stop once the circuit opens'
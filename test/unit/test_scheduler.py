@@ -0,0 +1,88 @@
+"""
+Multi Realm Scheduler Unit Tests
+"""
+import logging
+import os
+import sqlite3
+
+from test.common.utilities import get_mock_qbo
+
+from qbo_db_connector import QuickbooksExtractConnector, QuickbooksLoadConnector, QuickbooksSyncScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def mock_qbo_connection(realm_config):
+    """
+    Mock qbo sdk object for a realm, fails for realms marked broken
+    """
+    if realm_config.get('broken'):
+        raise ValueError('could not connect to realm {0}'.format(realm_config['realm_id']))
+
+    mock_qbo = get_mock_qbo()
+    mock_qbo.refresh_token = 'refresh-token-{0}'.format(realm_config['realm_id'])
+    return mock_qbo
+
+
+def realm_dbconn(realm_config):
+    """
+    Sqlite db connection of a realm with extract and load tables
+    """
+    sqlite_db_file = '/tmp/test_qbo_{0}.db'.format(realm_config['realm_id'])
+    conn = sqlite3.connect(sqlite_db_file)
+
+    if not conn.execute("select name from sqlite_master where name = 'qbo_load_checks'").fetchall():
+        QuickbooksExtractConnector(qbo_connection=None, dbconn=conn).create_tables()
+        QuickbooksLoadConnector(qbo_connection=None, dbconn=conn).create_tables()
+        conn.executescript(open('./test/common/mock_db_load.sql').read())
+
+    return conn
+
+
+def remove_realm_dbs(realm_ids):
+    """
+    Remove sqlite dbs of realms
+    """
+    for realm_id in realm_ids:
+        sqlite_db_file = '/tmp/test_qbo_{0}.db'.format(realm_id)
+        if os.path.exists(sqlite_db_file):
+            os.remove(sqlite_db_file)
+
+
+def test_scheduler_runs_realms_in_processes():
+    """
+    Test extract and load jobs across realms on a process pool with failures isolated per realm
+    """
+    realm_ids = ['R1', 'R2', 'R3']
+    remove_realm_dbs(realm_ids)
+
+    scheduler = QuickbooksSyncScheduler(
+        qbo_connection_factory=mock_qbo_connection, dbconn_factory=realm_dbconn, max_workers=2
+    )
+    result = scheduler.run([
+        {'realm_id': 'R1', 'extract': ['accounts', 'classes'], 'max_concurrency': 2},
+        {'realm_id': 'R2', 'broken': True, 'extract': ['accounts']},
+        {'realm_id': 'R3', 'extract': ['employees'], 'load': {'checks': ['C1'], 'journal_entries': ['J1']}},
+        {'realm_id': 'R1', 'load': {'checks': ['C1', 'C2']}}
+    ])
+
+    assert [realm['realm_id'] for realm in result['realms']] == realm_ids, 'realm order messed up'
+    assert result['succeeded'] == 2, 'two realms should succeed'
+    assert result['failed'] == ['R2'], 'broken realm should fail alone'
+    assert 'could not connect' in result['realms'][1]['error'], 'error not reported'
+
+    realm_1, _, realm_3 = result['realms']
+    assert len(realm_1['extracted']['accounts']) == 67, 'accounts not extracted'
+    assert sorted(realm_1['loaded']['checks']) == ['C1', 'C2'], 'checks not loaded'
+    assert realm_3['loaded']['journal_entries']['J1']['id'] == '1467', 'journal entry not loaded'
+
+    assert realm_1['refresh_token'] == 'refresh-token-R1', 'rotated refresh token not returned'
+    assert result['realms'][1]['refresh_token'] is None, 'broken realm should not have a refresh token'
+
+    assert result['records'] == 67 + 7 + 2 + 7 + 2, 'record count messed up'
+    assert result['throughput'] > 0, 'throughput not reported'
+
+    conn = sqlite3.connect('/tmp/test_qbo_R1.db')
+    assert conn.execute('select count(*) from qbo_extract_accounts').fetchone()[0] == 67, 'row count mismatch'
+
+    remove_realm_dbs(realm_ids)
@@ -0,0 +1,92 @@
+"""
+Sink Unit Tests
+"""
+import logging
+import os
+import shutil
+
+import pytest
+
+from test.common.utilities import dbconn_table_num_rows, mock_query_pages
+from qbo_db_connector import QuickbooksExtractConnector
+from qbo_db_connector.sinks import ParquetSink
+
+logger = logging.getLogger(__name__)
+
+SINK_PATH = '/tmp/test_qbo_parquet'
+
+
+@pytest.fixture
+def sink():
+    """
+    Parquet sink in an empty directory
+    """
+    shutil.rmtree(SINK_PATH, ignore_errors=True)
+    return ParquetSink(SINK_PATH, extract_date='2020-01-31')
+
+
+def test_parquet_sink_only(qbo, sink):
+    """
+    Test extracting to Parquet without a database
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    extract_connector = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=None, realm_id='R1', sink=sink)
+    account_ids = extract_connector.extract_accounts()
+    exchange_rates = extract_connector.extract_exchange_rates()
+
+    accounts = pq.read_table('{0}/accounts'.format(SINK_PATH), columns=['Id', 'realm_id', 'extract_date'])
+    assert sorted(accounts.column('Id').to_pylist()) == sorted(account_ids), 'account ids not matching'
+    assert set(accounts.column('realm_id').to_pylist()) == {'R1'}, 'realm partition not matching'
+    assert set(str(value) for value in accounts.column('extract_date').to_pylist()) == {'2020-01-31'}, \
+        'extract date partition not matching'
+
+    rates = pq.read_table(sink.partition_path('R1', 'exchange_rates'))
+    assert rates.num_rows == len(exchange_rates), 'exchange rate count not matching'
+    assert str(rates.schema.field('Rate').type) == 'double', 'Rate type not matching'
+    assert str(rates.schema.field('AsOfDate').type) == 'date32[day]', 'AsOfDate type not matching'
+
+
+def test_parquet_sink_alongside_db(qbo, dbconn, sink):
+    """
+    Test extracting to Parquet and the database
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    extract_connector = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=dbconn, realm_id='R1', sink=sink)
+    extract_connector.create_tables()
+    class_ids = extract_connector.extract_classes()
+
+    assert dbconn_table_num_rows(dbconn, 'qbo_extract_classes') == len(class_ids), 'row count mismatch'
+    assert pq.read_table(sink.partition_path('R1', 'classes')).num_rows == len(class_ids), 'parquet rows mismatch'
+
+
+def test_parquet_sink_replace(qbo, sink):
+    """
+    Test full extracts replace their partition while incremental writes append to it
+    """
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    extract_connector = QuickbooksExtractConnector(qbo_connection=qbo, dbconn=None, realm_id='R1', sink=sink)
+    account_ids = extract_connector.extract_accounts()
+    assert extract_connector.extract_accounts() == account_ids, 'account ids not matching'
+
+    qbo.accounts._get_request.side_effect = mock_query_pages('Account', qbo.accounts.get())
+    assert list(extract_connector.stream_extract('accounts')) == account_ids, 'streamed account ids not matching'
+
+    accounts = pq.read_table('{0}/accounts'.format(SINK_PATH), columns=['Id'])
+    assert sorted(accounts.column('Id').to_pylist()) == sorted(account_ids), 'full extracts should not duplicate rows'
+    assert os.listdir(os.path.dirname(sink.partition_path('R1', 'accounts'))) == ['extract_date=2020-01-31'], \
+        'staging directories should be removed'
+
+    with pytest.raises(ValueError):
+        with sink.replace('R1', 'accounts'):
+            sink.write('R1', 'accounts', {'Id': 'TEXT'}, [('A1',)])
+            raise ValueError('extract failed')
+
+    assert pq.read_table(sink.partition_path('R1', 'accounts')).num_rows == len(account_ids), \
+        'failed extract should leave the partition as it was'
+
+    sink.write('R1', 'accounts', {'Id': 'TEXT'}, [(account_ids[0],)])
+    assert pq.read_table(sink.partition_path('R1', 'accounts')).num_rows == len(account_ids) + 1, \
+        'writes outside replace() should append'
@@ -0,0 +1,48 @@
+"""
+Attachment Upload Body Unit Tests
+"""
+import base64
+import logging
+
+from qbo_db_connector.uploads import MultipartUpload, base64_length, content_type, encoded_bytes, encoded_text
+
+logger = logging.getLogger(__name__)
+
+
+def test_encoded_chunks():
+    """
+    Test chunked base64 encoding matches the encoding of the whole content
+    """
+    for size in [0, 1, 2, 3, 1000, 3 * 1024 + 1]:
+        content = bytes(range(256)) * (size // 256 + 1)
+        content = content[:size]
+        encoded = base64.b64encode(content)
+
+        assert b''.join(encoded_bytes(content, chunk_size=3 * 100)) == encoded, 'chunks not matching'
+        assert b''.join(encoded_text(encoded.decode(), chunk_size=100)) == encoded, 'text chunks not matching'
+        assert base64_length(size) == len(encoded), 'base64 length not matching'
+
+    assert content_type('Receipt.PNG') == 'image/png'
+    assert content_type('receipt.exe') is None
+
+
+def test_multipart_upload_reads():
+    """
+    Test the body reads the same in blocks as whole, and its length is known upfront
+    """
+    content = bytes(range(256)) * 100
+    upload = MultipartUpload('receipt.png', 'image/png', lambda: encoded_bytes(content, chunk_size=300),
+                             base64_length(len(content)))
+    whole = MultipartUpload('receipt.png', 'image/png', lambda: encoded_bytes(content),
+                            base64_length(len(content))).read()
+
+    blocks = []
+    block = upload.read(1000)
+    while block:
+        assert len(block) <= 1000, 'block larger than asked for'
+        blocks.append(block)
+        block = upload.read(1000)
+
+    assert b''.join(blocks) == whole, 'blocks not matching the whole body'
+    assert len(upload) == len(whole), 'length not matching the body'
+    assert base64.b64encode(content) in whole, 'content not in the body'